@@ -6,4 +6,5 @@ class ApiConfig(AppConfig):
     name = 'api'
     
     def ready(self):
+        import api.checks
         import api.signals  
@@ -0,0 +1,74 @@
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+User = get_user_model()
+
+# Tokens carry the user's tenant and superuser flag plus the permission
+# version current when they were issued. The version is a random token kept
+# in the shared cache and replaced whenever the user, their groups or their
+# permissions change (see api.signals). While a token's version still matches,
+# the request is authenticated from its claims alone; otherwise the user row
+# is loaded as before. A cache miss simply starts a new version.
+#
+# A per-process cache (locmem, dummy) cannot carry a bump made in another
+# worker, so with one configured every request loads the user row.
+
+
+def _version_key(user_id):
+    return f'user-perm-version:{user_id}'
+
+
+def permission_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_permission_version(user_ids):
+    cache.set_many({_version_key(user_id): uuid.uuid4().hex for user_id in user_ids}, timeout=None)
+
+
+def claims_cache_is_shared():
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache))
+
+
+def claims_are_current(token):
+    if not claims_cache_is_shared():
+        return False
+    version = token.get('perm_version')
+    return version is not None and version == permission_version(token[api_settings.USER_ID_CLAIM])
+
+
+def issue_tokens(user):
+    refresh = RefreshToken.for_user(user)
+    refresh['username'] = user.username
+    refresh['tenant_schema'] = user.tenant.schema_name if user.tenant_id else None
+    refresh['is_superuser'] = user.is_superuser
+    refresh['is_staff'] = user.is_staff
+    refresh['perm_version'] = permission_version(user.pk)
+    return refresh
+
+
+class TenantTokenUser(TokenUser):
+    @cached_property
+    def tenant_schema(self):
+        return self.token.get('tenant_schema')
+
+
+class TenantClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM in validated_token and claims_are_current(validated_token):
+            return TenantTokenUser(validated_token)
+        return super().get_user(validated_token)
@@ -0,0 +1,15 @@
+from django.core.checks import Tags, Warning, register
+
+from .authentication import claims_cache_is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_claims_cache(app_configs, **kwargs):
+    if claims_cache_is_shared():
+        return []
+    return [Warning(
+        "The default cache is per-process, so JWT claims are never trusted and "
+        "every authenticated request loads the user row.",
+        hint="Set CACHE_URL to a cache shared by all workers, e.g. redis://localhost:6379/0.",
+        id='api.W001',
+    )]
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema_template import refresh_template_schema
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or migrate the template schema (TENANT_BASE_SCHEMA) that new "
+        "tenant schemas are cloned from. Run it after every deploy that adds "
+        "tenant migrations."
+    )
+
+    def handle(self, *args, **options):
+        try:
+            schema_name = refresh_template_schema(verbosity=options['verbosity'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f"Template schema {schema_name} is up to date")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.schema_template import pending_template_migrations, template_schema_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Exit non-zero unless the template schema exists and has applied every "
+        "migration on disk. While it is stale, new tenants are migrated from "
+        "scratch instead of cloned."
+    )
+
+    def handle(self, *args, **options):
+        schema_name = template_schema_name()
+        if not schema_name:
+            raise CommandError("TENANT_BASE_SCHEMA is not set")
+        pending = pending_template_migrations(schema_name)
+        if pending is None:
+            raise CommandError(f"Template schema {schema_name} does not exist; run build_tenant_template")
+        if pending:
+            for migration in pending:
+                self.stderr.write(f"  unapplied: {migration}")
+            raise CommandError(f"Template schema {schema_name} is missing {len(pending)} migration(s); "
+                               f"run build_tenant_template")
+        self.stdout.write(f"Template schema {schema_name} is up to date")
@@ -0,0 +1,79 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django_tenants.postgresql_backend.base import is_valid_schema_name
+
+from api.provisioning import (DEFAULT_PAID_UNTIL, ensure_tenant, populate_tenant_schema, run_in_pool,
+                              warn_if_template_stale)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create N load-test tenants and fill each schema with years of generated "
+        "products, batches, purchases and sales, written with COPY. Schemas are "
+        "built and filled in parallel across a process pool. Tenants are named "
+        "<prefix>0001, <prefix>0002, ...; generate into new schemas only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help="Number of tenants to create.")
+        parser.add_argument('--prefix', default='load', help="Schema name prefix.")
+        parser.add_argument('--start', type=int, default=1, help="Number of the first tenant.")
+        parser.add_argument('--domain-suffix', default='localhost')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--products', type=int, default=1000, help="Products per tenant.")
+        parser.add_argument('--days', type=int, default=730, help="Days of trade to generate, ending today.")
+        parser.add_argument('--purchases-per-day', type=float, default=4)
+        parser.add_argument('--sales-per-day', type=float, default=300)
+        parser.add_argument('--items-per-bill', type=int, default=8, help="Most lines on one bill.")
+        parser.add_argument('--seed', type=int, default=0, help="Tenant n is generated with seed + n.")
+
+    def handle(self, *args, **options):
+        if options['count'] < 1 or options['items_per_bill'] < 1:
+            raise CommandError("count and --items-per-bill must be at least 1")
+        numbers = range(options['start'], options['start'] + options['count'])
+        specs = [
+            {
+                'schema_name': f"{options['prefix']}{number:04d}",
+                'name': f"Load test {number}",
+                'domain': f"{options['prefix']}{number:04d}.{options['domain_suffix']}",
+                'paid_until': DEFAULT_PAID_UNTIL,
+                'on_trial': False,
+            }
+            for number in numbers
+        ]
+        invalid = [spec['schema_name'] for spec in specs if not is_valid_schema_name(spec['schema_name'])]
+        if invalid:
+            raise CommandError(f"Invalid schema name(s): {', '.join(invalid[:5])}")
+
+        volumes = {
+            'products': options['products'],
+            'days': options['days'],
+            'purchases_per_day': options['purchases_per_day'],
+            'sales_per_day': options['sales_per_day'],
+            'items_per_bill': options['items_per_bill'],
+        }
+        warn_if_template_stale(self.stderr)
+
+        for spec in specs:
+            ensure_tenant(spec)
+
+        failures, rows = 0, 0
+        started = time.monotonic()
+        calls = [(spec['schema_name'], volumes, options['seed'] + number) for number, spec in zip(numbers, specs)]
+        results = run_in_pool(populate_tenant_schema, calls, options['processes'])
+        for count, (schema_name, error, elapsed, counts) in enumerate(results, 1):
+            if error:
+                failures += 1
+                self.stderr.write(f"[{count}/{len(specs)}] {schema_name} failed after {elapsed:.1f}s: {error}")
+                continue
+            rows += sum(counts.values())
+            summary = ', '.join(f"{value} {name}" for name, value in counts.items())
+            self.stdout.write(f"[{count}/{len(specs)}] {schema_name} filled in {elapsed:.1f}s: {summary}")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(f"Wrote {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 0.001):.0f} rows/s) "
+                          f"with {failures} failure(s)")
+        if failures:
+            raise CommandError(f"{failures} tenant(s) failed; drop their schemas before generating them again")
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.provisioning import build_tenant_schema, ensure_tenant, load_spec, run_in_pool, warn_if_template_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Create tenants from a CSV or JSON spec and build their schemas across a "
+        "process pool. Schemas listed in --state-file are skipped, so an "
+        "interrupted run can be restarted with the same arguments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('spec', help="CSV (with header) or JSON file of tenants.")
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--state-file', help="JSON file recording schemas already provisioned.")
+
+    def handle(self, *args, **options):
+        try:
+            specs = load_spec(options['spec'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        state_file = options['state_file']
+        done = set(self._load_state(state_file))
+        pending = [spec for spec in specs if spec['schema_name'] not in done]
+        self.stdout.write(f"{len(specs)} tenant(s) in spec, {len(pending)} to provision")
+
+        if pending:
+            warn_if_template_stale(self.stderr)
+
+        for spec in pending:
+            ensure_tenant(spec)
+
+        failures = 0
+        started = time.monotonic()
+        calls = [(spec['schema_name'],) for spec in pending]
+        results = run_in_pool(build_tenant_schema, calls, options['processes'])
+        for count, (schema_name, error, elapsed) in enumerate(results, 1):
+            if error:
+                failures += 1
+                self.stderr.write(f"[{count}/{len(pending)}] {schema_name} failed after {elapsed:.1f}s: {error}")
+                continue
+            done.add(schema_name)
+            self._save_state(state_file, done)
+            self.stdout.write(f"[{count}/{len(pending)}] {schema_name} ready in {elapsed:.1f}s")
+
+        self.stdout.write(f"Finished in {time.monotonic() - started:.1f}s with {failures} failure(s)")
+        if failures:
+            raise CommandError(f"{failures} tenant schema(s) failed; rerun to retry them")
+
+    def _load_state(self, path):
+        if not path or not os.path.exists(path):
+            return []
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+
+    def _save_state(self, path, done):
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump(sorted(done), handle)
+        os.replace(tmp_path, path)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.user_sync import drain_user_outbox
+
+
+class Command(BaseCommand):
+    help = "Copy users queued from tenant schemas into the public schema."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new users instead of exiting.")
+        parser.add_argument('--interval', type=float, default=5.0, help="Seconds to wait between polls with --loop.")
+
+    def handle(self, *args, **options):
+        while True:
+            total = 0
+            while True:
+                processed = drain_user_outbox(batch_size=options['batch_size'])
+                total += processed
+                if processed < options['batch_size']:
+                    break
+            if total:
+                self.stdout.write(f"Synced {total} queued user(s)")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
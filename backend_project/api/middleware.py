@@ -1,11 +1,26 @@
+import copy
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.http import Http404, JsonResponse
+from django_tenants.middleware.main import TenantMainMiddleware
 from django_tenants.utils import get_public_schema_name, get_tenant_model
 
 User = get_user_model()
 Tenant = get_tenant_model()
-from rest_framework.exceptions import NotAuthenticated
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .authentication import claims_are_current
 
 PUBLIC_TENANT_PATHS = [
     '/admin/',
@@ -19,38 +34,128 @@ PUBLIC_TENANT_PATHS = [
 
 STATIC_MEDIA_PATHS = ['/static/', '/media/']
 
-class TenantScopeMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+EXEMPT_PATHS = re.compile('|'.join(re.escape(p) for p in STATIC_MEDIA_PATHS + PUBLIC_TENANT_PATHS))
 
-    def __call__(self, request):
-        response = self.get_response(request)
-        
-        if not hasattr(request, 'tenant'):
-            return response
+TENANT_CACHE_VERSION_KEY = 'tenant-domain-version'
 
-        tenant = request.tenant
 
-        if tenant.schema_name == get_public_schema_name():
-            return response
+class TenantLRUCache:
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
 
-        path = request.path
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
 
-        if request.method == 'OPTIONS':
-            return response
-        if any(path.startswith(p) for p in STATIC_MEDIA_PATHS):
-            return response
-        if any(path.startswith(p) for p in PUBLIC_TENANT_PATHS):
-            return response
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_tenant_cache = TenantLRUCache(
+    max_size=getattr(settings, 'TENANT_CACHE_MAX_SIZE', 1024),
+    timeout=getattr(settings, 'TENANT_CACHE_TIMEOUT', 60),
+)
+
+
+def invalidate_tenant_cache():
+    # Other processes drop their local entries when TENANT_CACHE_TIMEOUT runs
+    # out; the shared entries are orphaned straight away by the new version.
+    local_tenant_cache.clear()
+    cache.set(TENANT_CACHE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
 
-        if not request.user.is_authenticated:
-            return response
 
-        if request.user.is_superuser:
-            return response
-        
+class CachedTenantMiddleware(TenantMainMiddleware):
+    """TenantMainMiddleware that remembers hostname -> tenant lookups.
 
-        if getattr(request.user, 'tenant', None) != tenant:
+    Hits are served from an in-process LRU first, then from the shared cache,
+    and only then from the Domain / Tenant tables.
+    """
+
+    def get_tenant(self, domain_model, hostname):
+        tenant = local_tenant_cache.get(hostname)
+        if tenant is None:
+            version = cache.get(TENANT_CACHE_VERSION_KEY)
+            if version is None:
+                version = uuid.uuid4().hex
+                cache.add(TENANT_CACHE_VERSION_KEY, version, timeout=None)
+                version = cache.get(TENANT_CACHE_VERSION_KEY, version)
+            key = f'tenant-domain:{version}:{hostname}'
+            tenant = cache.get(key)
+            if tenant is None:
+                tenant = super().get_tenant(domain_model, hostname)
+                cache.set(key, tenant, timeout=getattr(settings, 'TENANT_CACHE_TIMEOUT', 60))
+            local_tenant_cache.set(hostname, tenant)
+        # Callers set attributes such as domain_url on the tenant they get back.
+        return copy.copy(tenant)
+
+class TenantScopeMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.jwt_authentication = JWTAuthentication()
+
+    def __call__(self, request):
+        # Decide before the view runs, so a forbidden request costs no more
+        # than resolving who is asking.
+        if self.is_forbidden(request):
             return JsonResponse({"success": False, "message": "Forbidden"},status=403)
+        return self.get_response(request)
+
+    def is_forbidden(self, request):
+        tenant = getattr(request, 'tenant', None)
+        if tenant is None or tenant.schema_name == get_public_schema_name():
+            return False
+        if request.method == 'OPTIONS':
+            return False
+        if EXEMPT_PATHS.match(request.path):
+            return False
+
+        scope = self.user_scope(request)
+        if scope is None:
+            # Unauthenticated (or bad token): the view's own checks respond.
+            return False
+        tenant_schema, is_superuser = scope
+        return not is_superuser and tenant_schema != tenant.schema_name
+
+    def user_scope(self, request):
+        # (tenant schema, is_superuser) for the requesting user, read from the
+        # JWT claims while they are current and without loading the whole
+        # user row otherwise.
+        header = self.jwt_authentication.get_header(request)
+        if header is not None:
+            try:
+                raw_token = self.jwt_authentication.get_raw_token(header)
+                if raw_token is None:
+                    return None
+                token = self.jwt_authentication.get_validated_token(raw_token)
+            except (AuthenticationFailed, TokenError):
+                # Malformed header or bad token: DRF answers with a 401.
+                return None
+            if jwt_settings.USER_ID_CLAIM in token and claims_are_current(token):
+                return token.get('tenant_schema'), token.get('is_superuser', False)
+            return User.objects.filter(
+                **{jwt_settings.USER_ID_FIELD: token.get(jwt_settings.USER_ID_CLAIM)}
+            ).values_list('tenant__schema_name', 'is_superuser').first()
 
-        return response
\ No newline at end of file
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            return None
+        return (user.tenant.schema_name if user.tenant_id else None), user.is_superuser
@@ -12,6 +12,17 @@ class Tenant(TenantMixin):
 
     auto_create_schema = True
 
+    def get_base_schema(self):
+        # Cloning a template that is behind the migrations on disk and then
+        # faking them would leave the new schema missing tables, so a stale
+        # or missing template falls back to running the migrations.
+        from .schema_template import template_is_current
+
+        base_schema = super().get_base_schema()
+        if base_schema and template_is_current(base_schema):
+            return base_schema
+        return False
+
 
 class Domain(DomainMixin):
     pass
@@ -37,4 +48,27 @@ class User(AbstractUser):
         return self.is_staff and self.tenant is not None
 
     # class Meta:
-    #     db_table = 'public"."auth_user'
\ No newline at end of file
+    #     db_table = 'public"."auth_user'
+
+class UserSyncOutbox(models.Model):
+    # Tenant-schema users waiting to be copied into the public schema by the
+    # sync_tenant_users command. The password is stored already hashed.
+    schema_name = models.CharField(max_length=63)
+    username = models.CharField(max_length=150)
+    email = models.EmailField(blank=True)
+    first_name = models.CharField(max_length=150, blank=True)
+    last_name = models.CharField(max_length=150, blank=True)
+    password = models.CharField(max_length=128, blank=True)
+    is_staff = models.BooleanField(default=False)
+    is_superuser = models.BooleanField(default=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='user_sync_outbox_pending'),
+        ]
+
+    def __str__(self):
+        return f"{self.schema_name}/{self.username}"
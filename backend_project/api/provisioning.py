@@ -0,0 +1,123 @@
+import csv
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.utils.dateparse import parse_date
+from django_tenants.utils import schema_context, schema_exists
+
+from .models import Domain, Tenant
+from .schema_template import template_is_current
+
+DEFAULT_PAID_UNTIL = datetime.date(2099, 12, 31)
+TRUTHY = ('1', 'true', 'yes', 'on')
+
+
+def load_spec(path):
+    """Read tenant rows from a JSON list or a CSV file with a header row.
+
+    Each row needs ``schema_name``, ``name`` and ``domain``; ``paid_until``
+    and ``on_trial`` are optional.
+    """
+    with open(path, newline='', encoding='utf-8') as handle:
+        if os.path.splitext(path)[1].lower() == '.json':
+            rows = json.load(handle)
+        else:
+            rows = list(csv.DictReader(handle))
+
+    specs = []
+    for number, row in enumerate(rows, 1):
+        missing = [field for field in ('schema_name', 'name', 'domain') if not row.get(field)]
+        if missing:
+            raise ValueError(f"Row {number}: missing {', '.join(missing)}")
+        paid_until = row.get('paid_until')
+        on_trial = row.get('on_trial', True)
+        specs.append({
+            'schema_name': row['schema_name'].strip(),
+            'name': row['name'].strip(),
+            'domain': row['domain'].strip(),
+            'paid_until': parse_date(str(paid_until)) if paid_until else DEFAULT_PAID_UNTIL,
+            'on_trial': on_trial if isinstance(on_trial, bool) else str(on_trial).lower() in TRUTHY,
+        })
+    return specs
+
+
+def ensure_tenant(spec):
+    # Creates the Tenant and Domain rows only; the schema is built separately
+    # so it can happen in a worker process instead of inside this save.
+    with schema_context('public'), transaction.atomic():
+        tenant = Tenant.objects.filter(schema_name=spec['schema_name']).first()
+        if tenant is None:
+            tenant = Tenant(
+                schema_name=spec['schema_name'],
+                name=spec['name'],
+                paid_until=spec['paid_until'],
+                on_trial=spec['on_trial'],
+            )
+            tenant.auto_create_schema = False
+            tenant.save()
+        Domain.objects.get_or_create(domain=spec['domain'], defaults={'tenant': tenant, 'is_primary': True})
+    return tenant
+
+
+def build_tenant_schema(schema_name):
+    """Create (or finish migrating) one tenant schema. Runs in a worker process."""
+    started = time.monotonic()
+    try:
+        with schema_context('public'):
+            tenant = Tenant.objects.get(schema_name=schema_name)
+        # create_schema() returns None once it has built a schema, so whether
+        # one already exists is checked here rather than from its result.
+        if schema_exists(schema_name):
+            # The schema is left over from an earlier run; bring it up to date.
+            call_command('migrate_schemas', tenant=True, schema_name=schema_name, interactive=False, verbosity=0)
+        else:
+            tenant.create_schema(verbosity=0)
+        return schema_name, None, time.monotonic() - started
+    except Exception as exc:
+        return schema_name, f"{type(exc).__name__}: {exc}", time.monotonic() - started
+    finally:
+        connection.close()
+
+
+def populate_tenant_schema(schema_name, volumes, seed):
+    """Build one tenant schema and fill it with generated data. Runs in a worker process."""
+    # A tenant app; imported here so provisioning alone does not load it.
+    from tenant_data.synthetic import generate_tenant_data
+
+    schema_name, error, elapsed = build_tenant_schema(schema_name)
+    if error:
+        return schema_name, error, elapsed, None
+    started = time.monotonic()
+    try:
+        with schema_context(schema_name):
+            counts = generate_tenant_data(seed=seed, **volumes)
+        return schema_name, None, elapsed + time.monotonic() - started, counts
+    except Exception as exc:
+        return schema_name, f"{type(exc).__name__}: {exc}", elapsed + time.monotonic() - started, None
+    finally:
+        connection.close()
+
+
+def warn_if_template_stale(stderr):
+    if not template_is_current():
+        stderr.write("Template schema is missing or stale; schemas will be migrated from scratch. "
+                     "Run build_tenant_template first to clone instead.")
+
+
+def run_in_pool(function, calls, processes):
+    """Run ``function(*args)`` for each args tuple across a process pool.
+
+    Yields the results in the order they finish.
+    """
+    # Workers are forked from this process; they must not share its
+    # database connection.
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=max(1, processes)) as pool:
+        futures = [pool.submit(function, *args) for args in calls]
+        for future in as_completed(futures):
+            yield future.result()
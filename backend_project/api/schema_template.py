@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django_tenants.utils import get_public_schema_name, schema_exists
+
+
+def template_schema_name():
+    return getattr(settings, 'TENANT_BASE_SCHEMA', None) or None
+
+
+def pending_template_migrations(schema_name=None):
+    """Migrations on disk that the template schema has not applied.
+
+    Returns None when the template schema does not exist.
+    """
+    schema_name = schema_name or template_schema_name()
+    if not schema_name or not schema_exists(schema_name):
+        return None
+    previous = connection.tenant
+    # Without public on the search path, so a missing django_migrations table
+    # in the template is not answered by the public one.
+    connection.set_schema(schema_name, include_public=False)
+    try:
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        return [f'{migration.app_label}.{migration.name}' for migration, backwards in plan]
+    finally:
+        connection.set_tenant(previous)
+
+
+def template_is_current(schema_name=None):
+    return pending_template_migrations(schema_name) == []
+
+
+def refresh_template_schema(verbosity=1):
+    """Create the template schema if needed and migrate it to the latest state."""
+    schema_name = template_schema_name()
+    if not schema_name or schema_name == get_public_schema_name():
+        raise ValueError("TENANT_BASE_SCHEMA must name a schema other than public")
+    if not schema_exists(schema_name):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE SCHEMA "%s"' % schema_name)
+    call_command('migrate_schemas', tenant=True, schema_name=schema_name, interactive=False, verbosity=verbosity)
+    return schema_name
@@ -1,9 +1,12 @@
 # api/signals.py
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django_tenants.utils import get_public_schema_name, schema_context
-from django.db import connection  # ← This is correct
-from .models import User, Tenant
+from django.db import connection, transaction  # ← This is correct
+from .authentication import bump_permission_version
+from .middleware import invalidate_tenant_cache
+from .models import Domain, User, Tenant, UserSyncOutbox
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -11,6 +14,8 @@ User = get_user_model()
 
 @receiver(post_save, sender=User)
 def sync_tenant_user_to_public(sender, instance, created, **kwargs):
+    # Only queue the user here; sync_tenant_users copies queued users into
+    # the public schema in batches, reusing the stored password hash.
     current_schema = connection.schema_name 
 
     if current_schema == get_public_schema_name():
@@ -19,26 +24,55 @@ def sync_tenant_user_to_public(sender, instance, created, **kwargs):
     if not created:
         return 
 
-    try:
-        with schema_context('public'):
-            tenant = Tenant.objects.get(schema_name=current_schema)
-    except Tenant.DoesNotExist:
+    UserSyncOutbox.objects.create(
+        schema_name=current_schema,
+        username=instance.username,
+        email=instance.email,
+        first_name=instance.first_name,
+        last_name=instance.last_name,
+        password=instance.password,
+        is_staff=instance.is_staff,
+        is_superuser=instance.is_superuser,
+        is_active=instance.is_active,
+    )
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+@receiver(post_save, sender=Domain)
+@receiver(post_delete, sender=Domain)
+def invalidate_cached_tenants(sender, instance, **kwargs):
+    transaction.on_commit(invalidate_tenant_cache)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_claims(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_permission_version([instance.pk]))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_claims_on_user_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
         return
+    # Forward: instance is the user. Reverse: instance is the group or
+    # permission, and pk_set (None on clear) holds the affected users.
+    if not reverse:
+        user_ids = [instance.pk]
+    elif pk_set is not None:
+        user_ids = list(pk_set)
+    else:
+        user_ids = list(User.objects.values_list('pk', flat=True))
+    transaction.on_commit(lambda: bump_permission_version(user_ids))
 
-    with schema_context('public'):
-        public_user, user_created = User.objects.get_or_create(
-            username=instance.username,
-            defaults={
-                'email': instance.email,
-                'first_name': instance.first_name,
-                'last_name': instance.last_name,
-                'is_staff': instance.is_staff,
-                'is_superuser': instance.is_superuser,
-                'is_active': instance.is_active,
-            }
-        )
-        if instance.password and (user_created or instance.password != public_user.password):
-            public_user.set_password(instance.password)
-
-        public_user.tenant = tenant
-        public_user.save()
\ No newline at end of file
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_claims_on_group_permissions(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    groups = Group.objects.filter(pk__in=pk_set) if reverse and pk_set is not None else (
+        Group.objects.all() if reverse else Group.objects.filter(pk=instance.pk)
+    )
+    user_ids = list(User.objects.filter(groups__in=groups).values_list('pk', flat=True).distinct())
+    transaction.on_commit(lambda: bump_permission_version(user_ids))
@@ -1,3 +1,381 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import tempfile
+from io import StringIO
+from types import SimpleNamespace
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, Permission
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import F, Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django_tenants.test.cases import TenantTestCase
+from django_tenants.utils import schema_context, schema_exists
+from rest_framework.test import APIRequestFactory
+
+from tenant_data.models import Product, Product_Batch, PurchaseItem, Sale, SalesItem, StockSnapshot
+
+from .authentication import TenantClaimsJWTAuthentication, TenantTokenUser, issue_tokens
+from .checks import check_claims_cache
+from .middleware import CachedTenantMiddleware, TenantScopeMiddleware, invalidate_tenant_cache, local_tenant_cache
+from .models import Domain, Tenant, User, UserSyncOutbox
+from .permissions import HasRequiredPermissions, resolve_permissions
+from .schema_template import pending_template_migrations, template_is_current
+from .user_sync import drain_user_outbox
+from .views import user_permissions
+
+
+class TenantClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }))
+        self.user = User.objects.create_user(username='claims', password='claims', is_superuser=True)
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return TenantClaimsJWTAuthentication().authenticate(request)[0]
+
+    def test_current_claims_skip_the_user_lookup(self):
+        token = issue_tokens(self.user).access_token
+        with self.assertNumQueries(0):
+            user = self.authenticate(token)
+        self.assertIsInstance(user, TenantTokenUser)
+        self.assertTrue(user.is_superuser)
+
+    def test_demoted_superuser_is_loaded_again(self):
+        token = issue_tokens(self.user).access_token
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_superuser = False
+            self.user.save()
+        user = self.authenticate(token)
+        self.assertIsInstance(user, User)
+        self.assertFalse(user.is_superuser)
+
+    def test_process_local_cache_fails_closed(self):
+        # A bump in another worker would never reach this process's cache.
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            user = self.authenticate(issue_tokens(self.user).access_token)
+        self.assertIsInstance(user, User)
+        self.assertTrue(user.is_superuser)
+
+    def test_deploy_check_reports_process_local_cache(self):
+        self.assertEqual(check_claims_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_claims_cache(None)], ['api.W001'])
+
+
+class TenantScopeMiddlewareTests(SimpleTestCase):
+    def get(self, authorization):
+        request = APIRequestFactory().get('/api/my-permissions/', HTTP_AUTHORIZATION=authorization)
+        request.tenant = Tenant(schema_name='scoped')
+        return TenantScopeMiddleware(user_permissions)(request)
+
+    def test_malformed_header_is_left_to_the_view(self):
+        for authorization in ('Bearer a b', 'Bearer', 'Bearer not-a-token'):
+            with self.subTest(authorization=authorization):
+                self.assertEqual(self.get(authorization).status_code, 401)
+
+
+class PermissionResolutionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='perms', password='perms')
+        self.group = Group.objects.create(name='clerks')
+        self.group.permissions.add(Permission.objects.get(codename='view_user'))
+        self.user.groups.add(self.group)
+        self.user.user_permissions.add(Permission.objects.get(codename='change_user'))
+
+    def allowed(self, user, *required):
+        request = SimpleNamespace(user=user)
+        return HasRequiredPermissions().has_permission(request, SimpleNamespace(required_permissions=required))
+
+    def test_groups_and_permissions_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            resolved = resolve_permissions(self.user.pk)
+        # django-tenants sets the search path before the first statement.
+        statements = [query['sql'] for query in queries.captured_queries if not query['sql'].startswith('SET ')]
+        self.assertEqual(len(statements), 1, statements)
+        self.assertEqual(resolved, {'groups': ['clerks'], 'permissions': ['api.change_user', 'api.view_user']})
+        with self.assertNumQueries(0):
+            resolve_permissions(self.user.pk)
+
+    def test_permission_class_checks_the_resolved_permissions(self):
+        self.assertTrue(self.allowed(self.user, 'api.view_user', 'api.change_user'))
+        self.assertFalse(self.allowed(self.user, 'api.delete_user'))
+        self.assertTrue(self.allowed(User(username='root', is_superuser=True), 'api.delete_user'))
+        self.assertTrue(self.allowed(self.user))
+
+    def test_group_change_is_seen_at_once(self):
+        resolve_permissions(self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(Permission.objects.get(codename='delete_user'))
+        self.assertTrue(self.allowed(self.user, 'api.delete_user'))
+
+
+class CachedTenantMiddlewareTests(TenantTestCase):
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Cached'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        invalidate_tenant_cache()
+        self.addCleanup(invalidate_tenant_cache)
+        self.middleware = CachedTenantMiddleware(lambda request: None)
+
+    def resolve(self, hostname):
+        return self.middleware.get_tenant(Domain, hostname)
+
+    def test_lookups_are_served_from_the_caches(self):
+        self.assertEqual(self.resolve(self.domain.domain).pk, self.tenant.pk)
+        with self.assertNumQueries(0):
+            self.resolve(self.domain.domain)
+        # Another worker's local cache is empty; the shared cache answers.
+        local_tenant_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolve(self.domain.domain).pk, self.tenant.pk)
+
+    def test_domain_change_drops_cached_lookups(self):
+        domain = Domain.objects.get(pk=self.domain.pk)
+        hostname = domain.domain
+        self.resolve(hostname)
+        with self.captureOnCommitCallbacks(execute=True):
+            domain.domain = 'moved.test.com'
+            domain.save()
+        with self.assertRaises(Domain.DoesNotExist):
+            self.resolve(hostname)
+        self.assertEqual(self.resolve('moved.test.com').pk, self.tenant.pk)
+
+
+class UserOutboxDrainTests(TestCase):
+    def setUp(self):
+        self.tenant = Tenant(schema_name='outbox', name='Outbox', paid_until=datetime.date(2099, 12, 31))
+        self.tenant.auto_create_schema = False
+        self.tenant.save()
+
+    def queue(self, username, password, schema_name='outbox', **fields):
+        return UserSyncOutbox.objects.create(
+            schema_name=schema_name, username=username, password=make_password(password), **fields,
+        )
+
+    def test_drain_copies_the_latest_entry_per_user(self):
+        existing = User.objects.create_user(username='carol', password='before')
+        self.queue('alice', 'first', email='first@example.com')
+        self.queue('alice', 'second', email='second@example.com', is_staff=True)
+        self.queue('carol', 'after')
+        self.queue('ghost', 'ghost', schema_name='missing')
+
+        self.assertEqual(drain_user_outbox(), 4)
+
+        alice = User.objects.get(username='alice')
+        self.assertTrue(alice.check_password('second'))
+        self.assertEqual((alice.email, alice.is_staff, alice.tenant_id), ('second@example.com', True, self.tenant.pk))
+        existing.refresh_from_db()
+        self.assertTrue(existing.check_password('after'))
+        self.assertEqual(existing.tenant_id, self.tenant.pk)
+        self.assertFalse(User.objects.filter(username='ghost').exists())
+        self.assertFalse(UserSyncOutbox.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(drain_user_outbox(), 0)
+
+    def test_batch_size_limits_one_drain(self):
+        for number in range(3):
+            self.queue(f'user{number}', 'secret')
+        self.assertEqual(drain_user_outbox(batch_size=2), 2)
+        self.assertEqual(drain_user_outbox(batch_size=2), 1)
+        self.assertEqual(User.objects.filter(username__startswith='user').count(), 3)
+
+    def test_rows_claimed_by_another_worker_are_skipped(self):
+        # The rows are committed and one is locked from another connection,
+        # as a second sync_tenant_users worker would hold it.
+        other = connections.create_connection(connection.alias)
+        self.addCleanup(other.close)
+        with other.cursor() as cursor:
+            cursor.execute(
+                """INSERT INTO api_usersyncoutbox
+                       (schema_name, username, email, first_name, last_name, password,
+                        is_staff, is_superuser, is_active, created_at)
+                   SELECT 'outbox', name, '', '', '', %s, false, false, true, now()
+                   FROM unnest(ARRAY['locked', 'free']) AS name
+                   RETURNING id""",
+                [make_password('secret')],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        # Runs after the test transaction has been rolled back.
+        self.addClassCleanup(self.delete_committed_entries, ids)
+
+        with connection.cursor() as cursor:
+            # Fail instead of hanging if the drain waits for the locked row.
+            cursor.execute("SET LOCAL lock_timeout = '5s'")
+        other.set_autocommit(False)
+        with other.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM api_usersyncoutbox WHERE id = %s FOR UPDATE', [ids[0]])
+            self.assertEqual(drain_user_outbox(), 1)
+        other.rollback()
+        other.set_autocommit(True)
+
+        self.assertEqual(list(User.objects.filter(username__in=['locked', 'free']).values_list('username', flat=True)), ['free'])
+        self.assertEqual(list(UserSyncOutbox.objects.filter(processed_at__isnull=True).values_list('id', flat=True)), ids[:1])
+
+    @staticmethod
+    def delete_committed_entries(ids):
+        other = connections.create_connection(connection.alias)
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('DELETE FROM api_usersyncoutbox WHERE id = ANY(%s)', [ids])
+        finally:
+            other.close()
+
+
+class ProvisionTenantsTests(TransactionTestCase):
+    # Schemas are built in forked worker processes, which only see committed
+    # Tenant rows, so these tests cannot run inside a transaction.
+    schemas = ('prov_one', 'prov_two')
+
+    def setUp(self):
+        self.directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.state_file = os.path.join(self.directory, 'state.json')
+        self.addCleanup(self.drop_schemas)
+
+    def drop_schemas(self):
+        with connection.cursor() as cursor:
+            for schema_name in self.schemas:
+                cursor.execute(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE')
+
+    def write_spec(self, rows):
+        path = os.path.join(self.directory, 'tenants.csv')
+        with open(path, 'w', encoding='utf-8') as handle:
+            handle.write('schema_name,name,domain,on_trial\n')
+            handle.writelines(f'{row}\n' for row in rows)
+        return path
+
+    def provision(self, spec):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('provision_tenants', spec, processes=2, state_file=self.state_file, stdout=stdout, stderr=stderr)
+        return stdout.getvalue()
+
+    def test_builds_every_schema_and_records_progress(self):
+        spec = self.write_spec([
+            'prov_one,One,one.example.com,no',
+            'prov_two,Two,two.example.com,yes',
+        ])
+        output = self.provision(spec)
+
+        self.assertIn('2 tenant(s) in spec, 2 to provision', output)
+        self.assertIn('with 0 failure(s)', output)
+        for schema_name in self.schemas:
+            self.assertTrue(schema_exists(schema_name))
+            with schema_context(schema_name), connection.cursor() as cursor:
+                cursor.execute('SELECT count(*) FROM tenant_data_product')
+                self.assertEqual(cursor.fetchone(), (0,))
+        self.assertEqual(
+            sorted(Domain.objects.values_list('domain', 'tenant__schema_name', 'tenant__on_trial')),
+            [('one.example.com', 'prov_one', False), ('two.example.com', 'prov_two', True)],
+        )
+        with open(self.state_file, encoding='utf-8') as handle:
+            self.assertEqual(json.load(handle), list(self.schemas))
+
+        self.assertIn('2 tenant(s) in spec, 0 to provision', self.provision(spec))
+
+    def test_schemas_in_the_state_file_are_skipped(self):
+        with open(self.state_file, 'w', encoding='utf-8') as handle:
+            json.dump(['prov_one'], handle)
+        spec = self.write_spec([
+            'prov_one,One,one.example.com,no',
+            'prov_two,Two,two.example.com,no',
+        ])
+        self.assertIn('2 tenant(s) in spec, 1 to provision', self.provision(spec))
+        self.assertFalse(Tenant.objects.filter(schema_name='prov_one').exists())
+        self.assertTrue(schema_exists('prov_two'))
+
+    def test_incomplete_spec_is_rejected(self):
+        spec = self.write_spec(['prov_one,One,'])
+        with self.assertRaisesMessage(CommandError, 'Row 1: missing domain'):
+            self.provision(spec)
+        self.assertFalse(Tenant.objects.exists())
+
+
+@override_settings(TENANT_BASE_SCHEMA='template_check')
+class TenantTemplateTests(TestCase):
+    # Schema DDL is transactional in PostgreSQL, so the template built here
+    # is rolled back with the test.
+    def check(self):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('check_tenant_template', stdout=stdout, stderr=stderr)
+        return stdout.getvalue()
+
+    def test_missing_template_is_reported(self):
+        self.assertIsNone(pending_template_migrations())
+        self.assertFalse(template_is_current())
+        self.assertIs(Tenant(schema_name='fresh').get_base_schema(), False)
+        with self.assertRaisesMessage(CommandError, 'does not exist'):
+            self.check()
+
+    def test_template_behind_the_migrations_is_stale(self):
+        call_command('build_tenant_template', verbosity=0, stdout=StringIO())
+        self.assertEqual(pending_template_migrations(), [])
+        self.assertIn('is up to date', self.check())
+        self.assertEqual(Tenant(schema_name='fresh').get_base_schema(), 'template_check')
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM template_check.django_migrations WHERE app = 'tenant_data' AND name = %s",
+                ['0012_drop_default_ordering'],
+            )
+        self.assertEqual(pending_template_migrations(), ['tenant_data.0012_drop_default_ordering'])
+        self.assertIs(Tenant(schema_name='fresh').get_base_schema(), False)
+        with self.assertRaisesMessage(CommandError, 'missing 1 migration(s)'):
+            self.check()
+
+
+class GenerateTenantsTests(TransactionTestCase):
+    # Like provision_tenants, the schemas are filled in worker processes.
+    schemas = ('gen0001', 'gen0002')
+
+    def setUp(self):
+        self.addCleanup(self.drop_schemas)
+
+    def drop_schemas(self):
+        with connection.cursor() as cursor:
+            for schema_name in self.schemas:
+                cursor.execute(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE')
+
+    def test_generated_trade_is_consistent(self):
+        stdout = StringIO()
+        call_command(
+            'generate_tenants', 2, prefix='gen', processes=2, products=15, days=45,
+            purchases_per_day=2, sales_per_day=15, items_per_bill=3, seed=3,
+            stdout=stdout, stderr=StringIO(),
+        )
+        self.assertIn('with 0 failure(s)', stdout.getvalue())
+        self.assertEqual(sorted(Domain.objects.values_list('domain', flat=True)), ['gen0001.localhost', 'gen0002.localhost'])
+
+        for schema_name in self.schemas:
+            with schema_context(schema_name):
+                self.assertEqual(Product.objects.count(), 15)
+                self.assertTrue(SalesItem.objects.exists())
+                bought = dict(PurchaseItem.objects.values_list('product_batch_id', 'quantity'))
+                sold = dict(SalesItem.objects.values('product_batch_id').annotate(total=Sum('quantity'))
+                                             .values_list('product_batch_id', 'total'))
+                for pk, quantity in Product_Batch.objects.values_list('pk', 'quantity'):
+                    self.assertGreaterEqual(quantity, 0)
+                    self.assertEqual(quantity + sold.get(pk, 0), bought[pk])
+                # Sales only draw on batches already bought and not yet expired.
+                self.assertFalse(SalesItem.objects.filter(sold_at__lt=F('product_batch__added_date')).exists())
+                self.assertFalse(SalesItem.objects.filter(product_batch__expiry_date__lte=F('sold_at')).exists())
+                units = dict(SalesItem.objects.values('sale_id').annotate(total=Sum('quantity'))
+                                              .values_list('sale_id', 'total'))
+                self.assertEqual(dict(Sale.objects.values_list('pk', 'quantity')), units)
+                self.assertTrue(StockSnapshot.objects.exists())
+                # The bill counters were moved past every generated number.
+                last = Sale.objects.order_by('-bill_no').values_list('bill_no', flat=True).first()
+                bill = Sale.objects.create(customer_name='After', quantity=1)
+                self.assertGreater(bill.bill_no, last)
+
+    def test_count_must_be_positive(self):
+        with self.assertRaisesMessage(CommandError, 'at least 1'):
+            call_command('generate_tenants', 0, stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(Tenant.objects.exists())
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.utils import timezone
+from django_tenants.utils import schema_context
+
+from .authentication import bump_permission_version
+from .models import Tenant, User, UserSyncOutbox
+
+COPIED_FIELDS = ('email', 'first_name', 'last_name', 'is_staff', 'is_superuser', 'is_active')
+
+
+def drain_user_outbox(batch_size=500):
+    """Copy one batch of queued tenant users into the public schema.
+
+    Returns the number of outbox rows processed. Rows are claimed with
+    SKIP LOCKED, so several workers can drain the outbox at once.
+    """
+    with schema_context('public'), transaction.atomic():
+        entries = list(
+            UserSyncOutbox.objects.select_for_update(skip_locked=True)
+                                  .filter(processed_at__isnull=True)
+                                  .order_by('id')[:batch_size]
+        )
+        if not entries:
+            return 0
+
+        # Later entries for the same username win.
+        latest = {entry.username: entry for entry in entries}
+        tenants = Tenant.objects.in_bulk({entry.schema_name for entry in latest.values()}, field_name='schema_name')
+        existing = User.objects.in_bulk(list(latest), field_name='username')
+
+        created, updated = [], []
+        for username, entry in latest.items():
+            tenant = tenants.get(entry.schema_name)
+            if tenant is None:
+                continue
+            user = existing.get(username)
+            if user is None:
+                user = User(username=username, password=entry.password, tenant=tenant)
+                for field in COPIED_FIELDS:
+                    setattr(user, field, getattr(entry, field))
+                created.append(user)
+            else:
+                if entry.password:
+                    user.password = entry.password
+                user.tenant = tenant
+                updated.append(user)
+
+        User.objects.bulk_create(created)
+        User.objects.bulk_update(updated, ['password', 'tenant'])
+        UserSyncOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).update(processed_at=timezone.now())
+
+    # bulk_update skips post_save, so refresh the JWT claims of changed users here.
+    bump_permission_version([user.pk for user in updated])
+    return len(entries)
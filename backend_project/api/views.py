@@ -7,9 +7,10 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from rest_framework_simplejwt.tokens import RefreshToken
 
+from .authentication import issue_tokens
 from .models import Tenant
+from .permissions import resolve_permissions
 from .serializers import LoginSerializer, RegisterSerializer
 
 User = get_user_model()
@@ -21,9 +22,11 @@ User = get_user_model()
 def register(request):
     hostname = request.get_host().split(':')[0]
     schema_name = hostname.split('.')[0]
+    tenant = getattr(request, 'tenant', None)
     try:
-        with schema_context('public'):
-            tenant = Tenant.objects.get(schema_name=schema_name)
+        if tenant is None or tenant.schema_name != schema_name:
+            with schema_context('public'):
+                tenant = Tenant.objects.get(schema_name=schema_name)
     except Tenant.DoesNotExist:
         return Response(
             {"error": "Invalid domain – tenant not found"},
@@ -39,7 +42,7 @@ def register(request):
             user.tenant = tenant
             user.save()
 
-        refresh = RefreshToken.for_user(user)
+        refresh = issue_tokens(user)
         return Response({
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -57,7 +60,7 @@ def login(request):
     user = authenticate(username=username, password=password)
     if user:
         # token, _ = Token.objects.get_or_create(user=user)
-        refresh = RefreshToken.for_user(user)
+        refresh = issue_tokens(user)
         # return Response({'token': token.key})
         user_serializer = LoginSerializer(user)
         return Response({
@@ -74,12 +77,9 @@ def user_permissions(request):
     if not request.user.is_authenticated:
         return Response({'error': 'Authentication required'}, status=401)
 
-    groups = list(request.user.groups.values_list('name', flat=True))
-    user_permissions = list(request.user.user_permissions.values_list('codename', flat=True))
-    group_permissions = []
-    for group in request.user.groups.all():
-        group_permissions.extend(group.permissions.values_list('codename', flat=True))
-    all_permissions = list(set(user_permissions + group_permissions))
+    resolved = resolve_permissions(request.user.pk)
+    groups = resolved['groups']
+    all_permissions = sorted({perm.split('.', 1)[1] for perm in resolved['permissions']})
 
     return Response({
         'user': request.user.username,
@@ -88,12 +88,25 @@ SHOW_PUBLIC_IF_NO_TENANT_FOUND = True
  
 PUBLIC_SCHEMA_NAME = 'public'
 
+# New tenant schemas are cloned from this template (kept current by the
+# build_tenant_template command) and their migrations faked.
+TENANT_BASE_SCHEMA = env.str('TENANT_BASE_SCHEMA', default='tenant_template')
+TENANT_CREATION_FAKES_MIGRATIONS = env.bool('TENANT_CREATION_FAKES_MIGRATIONS', default=True)
+
+# Bill numbers reserved per round trip. Values above 1 reserve blocks on a separate autocommit
+# connection, so concurrent bills never wait on the counter; numbers of rolled back bills become gaps.
+BILL_NO_BLOCK_SIZE = env.int('BILL_NO_BLOCK_SIZE', default=1)
+
+# Hostname -> tenant lookups kept per process (and in the shared cache) for this many seconds.
+TENANT_CACHE_TIMEOUT = env.int('TENANT_CACHE_TIMEOUT', default=60)
+TENANT_CACHE_MAX_SIZE = env.int('TENANT_CACHE_MAX_SIZE', default=1024)
+
 DATABASE_ROUTERS = [
     'django_tenants.routers.TenantSyncRouter',
 ]
 
 MIDDLEWARE = [
-    "django_tenants.middleware.main.TenantMainMiddleware",
+    'api.middleware.CachedTenantMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -147,6 +160,19 @@ DATABASES = {
 }
 
 
+# Production needs a cache shared between workers (e.g. CACHE_URL=redis://...,
+# see .env.example). JWT claims are only trusted without a user lookup when it
+# is shared; with the locmem default every request loads the user row, which
+# `manage.py check --deploy` reports as api.W001.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
+# Seconds a stock ledger covering today stays cached; closed periods are kept
+# until a change to past stock invalidates them, unless the cache is per-process.
+LEDGER_CACHE_TIMEOUT = env.int('LEDGER_CACHE_TIMEOUT', default=300)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -169,13 +195,22 @@ AUTH_PASSWORD_VALIDATORS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': 
 (    
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.TenantClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
+        'api.permissions.HasRequiredPermissions',
     ],
 }
 
+# Default and maximum page sizes for the keyset-paginated tenant list endpoints.
+TENANT_LIST_PAGE_SIZE = env.int('TENANT_LIST_PAGE_SIZE', default=100)
+TENANT_LIST_MAX_PAGE_SIZE = env.int('TENANT_LIST_MAX_PAGE_SIZE', default=1000)
+
+# Seconds a user's resolved groups and permissions stay cached; changes
+# invalidate them immediately through the permission version.
+PERMISSION_CACHE_TIMEOUT = env.int('PERMISSION_CACHE_TIMEOUT', default=3600)
+
 from datetime import timedelta
 
 SIMPLE_JWT = {
@@ -1,7 +1,6 @@
 # admin.py
 from django.contrib import admin
-from django.db.models import Count, Sum
-from tenant_data.models import Product, Product_Batch, TenantData
+from tenant_data.models import Product, Product_Batch, StockSnapshot, TenantData
 
 
 @admin.register(TenantData)
@@ -43,22 +42,7 @@ class ProductAdmin(admin.ModelAdmin):
     total_selling_value.short_description = "Total Selling Value"
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(
-            _batch_count=Count('product_batch'),
-            _total_quantity=Sum('product_batch__quantity'),
-            _total_cost_price=Sum('product_batch__total_cost_price'),
-            _total_selling_price=Sum('product_batch__total_selling_price'),
-        )
-
-    def batch_count(self, obj):
-        return getattr(obj, '_batch_count', None) or obj.batch_count()
-    def total_quantity(self, obj):
-        return getattr(obj, '_total_quantity', None) or obj.total_quantity()
-    def total_cost_value(self, obj):
-        return getattr(obj, '_total_cost_price', None) or obj.total_cost_value()
-    def total_selling_value(self, obj):
-        return getattr(obj, '_total_selling_price', None) or obj.total_selling_value()
+        return super().get_queryset(request).with_stock_totals()
     
     
 @admin.register(Product_Batch)
@@ -76,4 +60,12 @@ class ProductBatchAdmin(admin.ModelAdmin):
     )
     list_filter = ('product', 'added_date')
     search_fields = ('batch_number', 'product__name')
-    readonly_fields = ('added_date', 'total_cost_price', 'total_selling_price')
\ No newline at end of file
+    readonly_fields = ('added_date', 'total_cost_price', 'total_selling_price')
+    ordering = ('-added_date',)
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('product', 'date', 'quantity', 'cost_value', 'selling_value')
+    list_filter = ('date',)
+    search_fields = ('product__name',)
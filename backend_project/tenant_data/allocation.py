@@ -0,0 +1,34 @@
+from django.utils import timezone
+
+
+def allocation_key(batch):
+    # First expiry, first out; batches without an expiry date (non-expirable
+    # products) follow, oldest first.
+    return (batch.expiry_date is None, batch.expiry_date or batch.added_date, batch.added_date, batch.pk)
+
+
+def sellable(batch, now=None):
+    now = now or timezone.now()
+    return batch.expiry_date is None or batch.expiry_date > now
+
+
+def allocate(candidates, quantity, remaining):
+    """Split ``quantity`` across ``candidates`` in allocation order.
+
+    ``remaining`` maps batch ids to stock not yet allocated on this bill and
+    is reduced by what is taken. Returns ``[(batch, quantity), ...]``, or
+    None (leaving ``remaining`` untouched) when there is not enough stock.
+    """
+    allocations = []
+    for batch in sorted(candidates, key=allocation_key):
+        if quantity == 0:
+            break
+        take = min(quantity, remaining[batch.pk])
+        if take > 0:
+            allocations.append((batch, take))
+            quantity -= take
+    if quantity:
+        return None
+    for batch, take in allocations:
+        remaining[batch.pk] -= take
+    return allocations
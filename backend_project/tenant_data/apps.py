@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TenantDataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tenant_data'
+
+    def ready(self):
+        import tenant_data.signals
@@ -0,0 +1,79 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.utils import timezone
+
+from .ledger import day_start
+
+# Ledger entries are keyed by two per-schema generation tokens. Any stock
+# movement replaces the "current" token, which only periods reaching today
+# depend on; changes that rewrite history (edits, deletes, backdated
+# purchases, product changes) also replace the "history" token, which every
+# entry depends on. Old entries are never deleted, just no longer read, and
+# age out through the cache backend's eviction.
+#
+# A per-process cache (locmem, dummy) never sees a token replaced by another
+# worker, so there every entry expires after LEDGER_CACHE_TIMEOUT, closed
+# periods included.
+CURRENT = 'current'
+HISTORY = 'history'
+
+
+def _cache():
+    return caches[getattr(settings, 'LEDGER_CACHE_ALIAS', 'default')]
+
+
+def _is_shared():
+    return not isinstance(_cache(), (LocMemCache, DummyCache))
+
+
+def _schema():
+    return getattr(connection, 'schema_name', 'public')
+
+
+def _generation(schema, scope):
+    key = f'ledger-gen:{schema}:{scope}'
+    token = _cache().get(key)
+    if token is None:
+        _cache().add(key, uuid.uuid4().hex, timeout=None)
+        token = _cache().get(key)
+    return token
+
+
+def _is_closed(end_date):
+    return end_date < day_start(timezone.localdate())
+
+
+def _entry(variant, start_date, end_date):
+    schema = _schema()
+    key = f'ledger:{schema}:{variant}:{start_date.isoformat()}:{end_date.isoformat()}:{_generation(schema, HISTORY)}'
+    if _is_closed(end_date) and _is_shared():
+        return key, None
+    key = f'{key}:{_generation(schema, CURRENT)}'
+    return key, getattr(settings, 'LEDGER_CACHE_TIMEOUT', 300)
+
+
+def get_cached_ledger(variant, start_date, end_date):
+    key, _ = _entry(variant, start_date, end_date)
+    return _cache().get(key)
+
+
+def cached_ledger(variant, start_date, end_date, compute):
+    # Closed periods are kept until history changes; open ones also expire,
+    # as do all of them when the cache is per-process.
+    key, timeout = _entry(variant, start_date, end_date)
+    data = _cache().get(key)
+    if data is None:
+        data = compute()
+        _cache().set(key, data, timeout=timeout)
+    return data
+
+
+def invalidate_ledger_cache(history=False):
+    schema = _schema()
+    scopes = (CURRENT, HISTORY) if history else (CURRENT,)
+    _cache().set_many({f'ledger-gen:{schema}:{scope}': uuid.uuid4().hex for scope in scopes}, timeout=None)
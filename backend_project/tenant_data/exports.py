@@ -0,0 +1,82 @@
+from .models import Purchase, PurchaseItem, Sale, SalesItem
+from .streaming import EXPORT_CHUNK_SIZE
+
+LEDGER_SECTIONS = ('opening', 'purchases', 'sales', 'closing')
+SUMMARY_FIELDS = ('quantity', 'avg_cost_price', 'avg_selling_price')
+
+LEDGER_HEADER = ['product_name', *(f'{section}_{field}' for section in LEDGER_SECTIONS for field in SUMMARY_FIELDS)]
+SEPARATED_HEADER = ['section', 'product_id', 'product_name', *SUMMARY_FIELDS]
+
+# (column, lookup) pairs for the registers, one row per bill or per line item.
+SALE_COLUMNS = (
+    ('bill_no', 'bill_no'),
+    ('created_at', 'created_at'),
+    ('customer_name', 'customer_name'),
+    ('quantity', 'quantity'),
+    ('total_amount', 'total_amount'),
+    ('notes', 'notes'),
+)
+SALE_ITEM_COLUMNS = (
+    ('bill_no', 'sale__bill_no'),
+    ('created_at', 'sale__created_at'),
+    ('customer_name', 'sale__customer_name'),
+    ('product_name', 'product_name'),
+    ('batch_number', 'batch_number'),
+    ('quantity', 'quantity'),
+    ('selling_rate', 'selling_rate'),
+    ('total_selling_price', 'total_selling_price'),
+    ('cost_rate', 'cost_rate'),
+    ('total_cost_price', 'total_cost_price'),
+)
+PURCHASE_COLUMNS = (
+    ('bill_no', 'bill_no'),
+    ('purchase_date', 'purchase_date'),
+    ('created_at', 'created_at'),
+    ('supplier_name', 'supplier_name'),
+    ('total_amount', 'total_amount'),
+    ('notes', 'notes'),
+)
+PURCHASE_ITEM_COLUMNS = (
+    ('bill_no', 'purchase__bill_no'),
+    ('purchase_date', 'purchase__purchase_date'),
+    ('created_at', 'purchase__created_at'),
+    ('supplier_name', 'purchase__supplier_name'),
+    ('product_name', 'product_name'),
+    ('batch_number', 'batch_number'),
+    ('quantity', 'quantity'),
+    ('cost_rate', 'cost_rate'),
+    ('total_cost_price', 'total_cost_price'),
+    ('selling_rate', 'selling_rate'),
+    ('total_selling_price', 'total_selling_price'),
+)
+
+
+def ledger_rows(entries):
+    for entry in entries:
+        yield [entry['product_name'], *(entry[section][field] for section in LEDGER_SECTIONS for field in SUMMARY_FIELDS)]
+
+
+def separated_rows(buckets):
+    for name, entries in buckets.items():
+        for entry in entries:
+            yield [name, entry['product_id'], entry['product_name'], *(entry[field] for field in SUMMARY_FIELDS)]
+
+
+def _register(queryset, columns, ordering):
+    header = [name for name, _ in columns]
+    rows = queryset.order_by(*ordering) \
+                   .values_list(*(lookup for _, lookup in columns)) \
+                   .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    return header, rows
+
+
+def sales_register(include_items=True):
+    if include_items:
+        return _register(SalesItem.objects.all(), SALE_ITEM_COLUMNS, ('sold_at', 'sale_id', 'pk'))
+    return _register(Sale.objects.all(), SALE_COLUMNS, ('created_at', 'pk'))
+
+
+def purchases_register(include_items=True):
+    if include_items:
+        return _register(PurchaseItem.objects.all(), PURCHASE_ITEM_COLUMNS, ('purchase__created_at', 'purchase_id', 'pk'))
+    return _register(Purchase.objects.all(), PURCHASE_COLUMNS, ('created_at', 'pk'))
@@ -0,0 +1,137 @@
+import csv
+import io
+import json
+import os
+
+from django.db import transaction
+from django.db.models.functions import Upper
+
+from .cache import invalidate_ledger_cache
+from .models import Product, Product_Batch
+from .serializers import BULK_BATCH_SIZE, BatchImportSerializer, ProductSerializer
+from .snapshots import refresh_stock_snapshots_on_commit
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+# Rows past this many failures are still counted, just not described.
+MAX_REPORTED_ERRORS = 1000
+
+
+def import_format(filename, default='csv'):
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    if extension == '.csv':
+        return 'csv'
+    return default
+
+
+def _clean(record):
+    # Blank cells mean "not given", so optional fields fall back to defaults.
+    cleaned = {}
+    for key, value in record.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip()
+            if value == '':
+                continue
+        cleaned[key.strip()] = value
+    return cleaned
+
+
+def iter_rows(stream, fmt):
+    """Yield ``(row_number, record, error)`` from a binary CSV or JSONL stream.
+
+    The stream is decoded and parsed a line at a time, so the whole file is
+    never held in memory.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for number, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield number, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(record, dict):
+                yield number, None, "Expected a JSON object."
+                continue
+            yield number, _clean(record), None
+    else:
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, _clean(record), None
+
+
+def _import(rows, serializer_class, context, build, model):
+    result = {'created': 0, 'failed': 0, 'errors': []}
+    pending = []
+
+    def flush():
+        model.objects.bulk_create(pending, batch_size=BULK_BATCH_SIZE)
+        result['created'] += len(pending)
+        pending.clear()
+
+    with transaction.atomic():
+        for number, record, error in rows:
+            if error is None:
+                serializer = serializer_class(data=record, context=context)
+                if serializer.is_valid():
+                    pending.append(build(serializer.validated_data))
+                    if len(pending) >= BULK_BATCH_SIZE:
+                        flush()
+                    continue
+                error = serializer.errors
+            result['failed'] += 1
+            if len(result['errors']) < MAX_REPORTED_ERRORS:
+                result['errors'].append({'row': number, 'errors': error})
+        flush()
+        # bulk_create sends no post_save, so the ledger cache is not told.
+        if result['created']:
+            transaction.on_commit(lambda: invalidate_ledger_cache(history=True))
+    return result
+
+
+def import_products(rows):
+    existing_names = set(Product.objects.annotate(upper_name=Upper('name')).values_list('upper_name', flat=True))
+
+    def build(data):
+        existing_names.add(data['name'].upper())
+        return Product(**data)
+
+    return _import(rows, ProductSerializer, {'existing_names': existing_names}, build, Product)
+
+
+def import_batches(rows):
+    products, product_names = {}, {}
+    for pk, upper_name, expirable in Product.objects.values_list('pk', Upper('name'), 'expirable'):
+        products[pk] = expirable
+        product_names.setdefault(upper_name, pk)
+    batch_numbers = set(
+        Product_Batch.objects.exclude(batch_number__isnull=True)
+                             .exclude(batch_number__exact='')
+                             .values_list(Upper('batch_number'), flat=True)
+    )
+    touched = set()
+
+    def build(data):
+        if data.get('batch_number'):
+            batch_numbers.add(data['batch_number'].upper())
+        touched.add(data['product_id'])
+        batch = Product_Batch(**data)
+        batch.set_totals()
+        return batch
+
+    context = {'products': products, 'product_names': product_names, 'batch_numbers': batch_numbers}
+    with transaction.atomic():
+        result = _import(rows, BatchImportSerializer, context, build, Product_Batch)
+        refresh_stock_snapshots_on_commit(touched)
+    return result
+
+
+IMPORTERS = {
+    'products': import_products,
+    'batches': import_batches,
+}
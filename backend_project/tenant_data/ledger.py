@@ -0,0 +1,228 @@
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, Q, Sum
+from django.utils import timezone
+
+from .models import Product, Product_Batch, PurchaseItem, SalesItem, StockSnapshot
+
+ZERO = Decimal('0')
+VALUE_FIELD = DecimalField(max_digits=20, decimal_places=2)
+
+
+def value_sum(quantity, rate, condition=None):
+    return Sum(F(quantity) * F(rate), filter=condition, output_field=VALUE_FIELD)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def nearest_snapshots(day):
+    # Latest snapshot per product on or before ``day``. Each row is the stock
+    # at the end of its own date, which may be well before ``day``.
+    rows = StockSnapshot.objects.filter(date__lte=day).order_by('product', '-date').distinct('product')
+    return {
+        row.product_id: {'date': row.date, 'qty': row.quantity, 'cost': row.cost_value, 'selling': row.selling_value}
+        for row in rows.only('product_id', 'date', 'quantity', 'cost_value', 'selling_value')
+    }
+
+
+def _snapshot_cutoffs(snapshots):
+    # A snapshot covers its product up to the end of its own date. Products
+    # are grouped by that date so each cutoff is a plain range condition.
+    by_date = defaultdict(list)
+    for product_id, row in snapshots.items():
+        by_date[row['date']].append(product_id)
+    return [(product_ids, day_start(date + datetime.timedelta(days=1))) for date, product_ids in by_date.items()]
+
+
+def _any_of(conditions):
+    combined = Q()
+    for condition in conditions:
+        combined = combined | condition if combined else condition
+    return combined
+
+
+def _sales_stock(prefix, condition):
+    return {
+        f'{prefix}_qty': Sum('quantity', filter=condition),
+        f'{prefix}_cost': value_sum('quantity', 'product_batch__cost_rate', condition),
+        f'{prefix}_selling': value_sum('quantity', 'product_batch__selling_rate', condition),
+    }
+
+
+def stock_at(point, inclusive=False):
+    """Stock held per product just before ``point``, or at it if ``inclusive``."""
+    # Start from each product's latest snapshot before the day of ``point``
+    # and apply the batches added and sales made after that snapshot's own
+    # date, so gaps in snapshot coverage are replayed rather than skipped.
+    # Products without a snapshot replay every batch: its current quantity
+    # plus whatever was sold after point.
+    before = 'lte' if inclusive else 'lt'
+    after = 'gt' if inclusive else 'gte'
+    snapshots = nearest_snapshots(timezone.localdate(point) - datetime.timedelta(days=1))
+    stock = {
+        product_id: {key: row[key] for key in ('qty', 'cost', 'selling')}
+        for product_id, row in snapshots.items()
+    }
+
+    added = Q(**{f'added_date__{before}': point})
+    sold_back = Q(**{f'product_batch__added_date__{before}': point, f'sold_at__{after}': point})
+    sold_since = None
+    cutoffs = _snapshot_cutoffs(snapshots)
+    if cutoffs:
+        unsnapshotted = ~Q(product__in=list(snapshots))
+        added &= unsnapshotted | _any_of(
+            Q(product__in=product_ids, added_date__gte=cutoff) for product_ids, cutoff in cutoffs
+        )
+        sold_back &= unsnapshotted | _any_of(
+            Q(product__in=product_ids, product_batch__added_date__gte=cutoff) for product_ids, cutoff in cutoffs
+        )
+        sold_since = Q(**{f'sold_at__{before}': point}) & _any_of(
+            Q(product__in=product_ids, product_batch__added_date__lt=cutoff, sold_at__gte=cutoff)
+            for product_ids, cutoff in cutoffs
+        )
+
+    batches = Product_Batch.objects.order_by().filter(added).values('product').annotate(
+        qty=Sum('quantity'),
+        cost=value_sum('quantity', 'cost_rate'),
+        selling=value_sum('quantity', 'selling_rate'),
+    )
+    for row in batches:
+        _add_stock(stock, row.pop('product'), row)
+
+    # Sales are valued at the batch rates, as the batch quantities are.
+    sales = SalesItem.objects.order_by()
+    if sold_since is None:
+        sales = sales.filter(sold_back).values('product').annotate(**_sales_stock('back', sold_back))
+    else:
+        sales = sales.filter(sold_back | sold_since).values('product').annotate(
+            **_sales_stock('back', sold_back),
+            **_sales_stock('since', sold_since),
+        )
+    for row in sales:
+        product_id = row['product']
+        _add_stock(stock, product_id, {key: row[f'back_{key}'] for key in ('qty', 'cost', 'selling')})
+        if sold_since is not None:
+            _add_stock(stock, product_id, {key: row[f'since_{key}'] for key in ('qty', 'cost', 'selling')}, sign=-1)
+    return stock
+
+
+def _add_stock(stock, product_id, row, sign=1):
+    current = stock.setdefault(product_id, {'qty': 0, 'cost': ZERO, 'selling': ZERO})
+    current['qty'] += sign * (row['qty'] or 0)
+    current['cost'] += sign * (row['cost'] or ZERO)
+    current['selling'] += sign * (row['selling'] or ZERO)
+
+
+def _sales_totals(start_date, end_date):
+    rows = SalesItem.objects.order_by().filter(
+        sold_at__gte=start_date,
+        sold_at__lte=end_date,
+    ).values('product').annotate(
+        sales_qty=Sum('quantity'),
+        sales_cost=Sum('total_cost_price'),
+        sales_selling=Sum('total_selling_price'),
+    )
+    return {row.pop('product'): row for row in rows}
+
+
+def _purchase_totals(start_date, end_date):
+    rows = PurchaseItem.objects.order_by().filter(
+        purchased_at__gte=start_date,
+        purchased_at__lte=end_date,
+    ).values('product').annotate(
+        purchase_qty=Sum('quantity'),
+        purchase_cost=Sum('total_cost_price'),
+        purchase_selling=Sum('total_selling_price'),
+    )
+    return {row.pop('product'): row for row in rows}
+
+
+def _summary(quantity, total_cost, total_selling):
+    total_cost = total_cost or ZERO
+    total_selling = total_selling or ZERO
+    return {
+        'quantity': quantity,
+        'avg_cost_price': total_cost / quantity if quantity > 0 else ZERO,
+        'avg_selling_price': total_selling / quantity if quantity > 0 else ZERO,
+    }
+
+
+def _stock_summary(stock):
+    return _summary(Decimal(stock.get('qty', 0)), stock.get('cost'), stock.get('selling'))
+
+
+def load_ledger_totals(start_date, end_date):
+    return {
+        'opening': stock_at(start_date),
+        'closing': stock_at(end_date, inclusive=True),
+        'sales': _sales_totals(start_date, end_date),
+        'purchases': _purchase_totals(start_date, end_date),
+    }
+
+
+def iter_stock_ledger(start_date, end_date, totals=None):
+    # Passing the same (possibly empty) totals dict to several passes runs the
+    # aggregate queries once, on the first row requested.
+    if totals is None:
+        totals = {}
+    if not totals:
+        totals.update(load_ledger_totals(start_date, end_date))
+
+    products = Product.objects.order_by('pk').values_list('pk', 'name')
+    for product_id, name in products.iterator(chunk_size=2000):
+        sales = totals['sales'].get(product_id, {})
+        purchases = totals['purchases'].get(product_id, {})
+        yield {
+            'product_id': product_id,
+            'product_name': name,
+            'opening': _stock_summary(totals['opening'].get(product_id, {})),
+            'purchases': _summary(
+                purchases.get('purchase_qty') or ZERO,
+                purchases.get('purchase_cost'),
+                purchases.get('purchase_selling'),
+            ),
+            'sales': _summary(
+                sales.get('sales_qty') or ZERO,
+                sales.get('sales_cost'),
+                sales.get('sales_selling'),
+            ),
+            'closing': _stock_summary(totals['closing'].get(product_id, {})),
+        }
+
+
+def ledger_entries(rows):
+    for row in rows:
+        yield {
+            'product_name': row['product_name'],
+            'opening': row['opening'],
+            'purchases': row['purchases'],
+            'sales': row['sales'],
+            'closing': row['closing'],
+        }
+
+
+SEPARATED_BUCKETS = (
+    ('openings', 'opening'),
+    ('purchases', 'purchases'),
+    ('sales', 'sales'),
+    ('closings', 'closing'),
+)
+
+
+def bucket_entries(rows, section):
+    for row in rows:
+        summary = row[section]
+        if summary['quantity'] > 0:
+            yield {'product_id': row['product_id'], 'product_name': row['product_name'], **summary}
+
+
+def separated_ledger(rows):
+    buckets = {name: [] for name, _ in SEPARATED_BUCKETS}
+    for row in rows:
+        for name, section in SEPARATED_BUCKETS:
+            buckets[name].extend(bucket_entries([row], section))
+    return buckets
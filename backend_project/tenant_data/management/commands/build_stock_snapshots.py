@@ -0,0 +1,42 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from tenant_data.models import StockSnapshot
+from tenant_data.snapshots import build_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the daily stock snapshots used by the stock ledger. Run it per "
+        "tenant, e.g. `manage.py tenant_command build_stock_snapshots --schema=flat1`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="First day to rebuild (YYYY-MM-DD). Defaults to --until.")
+        parser.add_argument('--until', help="Last day to rebuild (YYYY-MM-DD). Defaults to today.")
+
+    def handle(self, *args, **options):
+        until = self._parse_day(options['until']) or timezone.localdate()
+        since = self._parse_day(options['since']) or until
+        if since > until:
+            raise CommandError("--since must not be after --until")
+
+        with transaction.atomic():
+            StockSnapshot.objects.filter(date__gte=since, date__lte=until).delete()
+            day = since
+            while day <= until:
+                written = build_snapshot(day)
+                self.stdout.write(f"{day}: {written} snapshot(s)")
+                day += datetime.timedelta(days=1)
+
+    def _parse_day(self, value):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Invalid date: {value}")
+        return day
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tenant_data.importer import IMPORTERS, IMPORT_FORMATS, import_format, iter_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products or batches from a CSV or JSONL file. Run it per "
+        "tenant, e.g. `manage.py tenant_command import_catalog products "
+        "products.csv --schema=flat1`. Invalid rows are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=IMPORT_FORMATS,
+                            help="Defaults to the file extension (.jsonl/.ndjson or .csv).")
+
+    def handle(self, *args, **options):
+        fmt = options['file_format'] or import_format(options['path'])
+        try:
+            with open(options['path'], 'rb') as handle:
+                result = IMPORTERS[options['kind']](iter_rows(handle, fmt))
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        for error in result['errors']:
+            self.stderr.write(f"row {error['row']}: {json.dumps(error['errors'])}")
+        self.stdout.write(f"Created {result['created']} {options['kind']}, {result['failed']} row(s) failed")
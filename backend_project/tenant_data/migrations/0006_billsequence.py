@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:41
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_bill_sequences(apps, schema_editor):
+    # Bill numbers used to be derived from the last primary key, so the
+    # highest id is the highest number handed out so far.
+    BillSequence = apps.get_model('tenant_data', 'BillSequence')
+    for name, model_name in (('purchase', 'Purchase'), ('sale', 'Sale')):
+        model = apps.get_model('tenant_data', model_name)
+        last = model.objects.aggregate(last=Max('id'))['last'] or 0
+        BillSequence.objects.create(name=name, last_value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenant_data', '0005_stocksnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_bill_sequences, migrations.RunPython.noop),
+    ]
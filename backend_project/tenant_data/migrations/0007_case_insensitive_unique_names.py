@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:51
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import Upper
+
+
+def check_duplicates(apps, schema_editor):
+    # Fail with the offending values rather than a bare IntegrityError when
+    # existing rows already collide case-insensitively.
+    Product = apps.get_model('tenant_data', 'Product')
+    Product_Batch = apps.get_model('tenant_data', 'Product_Batch')
+    duplicates = {
+        'product names': Product.objects.values(key=Upper('name')),
+        'batch numbers': Product_Batch.objects.exclude(batch_number__isnull=True)
+                                              .exclude(batch_number='')
+                                              .values(key=Upper('batch_number')),
+    }
+    problems = []
+    for label, rows in duplicates.items():
+        keys = list(rows.order_by().annotate(n=Count('pk')).filter(n__gt=1).values_list('key', flat=True)[:20])
+        if keys:
+            problems.append(f"duplicate {label} (ignoring case): {', '.join(keys)}")
+    if problems:
+        raise RuntimeError(f"Resolve these before migrating schema {schema_editor.connection.schema_name}: "
+                           + '; '.join(problems))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenant_data', '0006_billsequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Upper('name'), name='unique_product_name_ci'),
+        ),
+        migrations.AddConstraint(
+            model_name='product_batch',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Upper('batch_number'), condition=models.Q(('batch_number__isnull', False), models.Q(('batch_number', ''), _negated=True)), name='unique_batch_number_ci'),
+        ),
+    ]
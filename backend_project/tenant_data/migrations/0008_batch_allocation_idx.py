@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenant_data', '0007_case_insensitive_unique_names'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product_batch',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['product', 'expiry_date', 'added_date'], name='batch_allocation_idx'),
+        ),
+    ]
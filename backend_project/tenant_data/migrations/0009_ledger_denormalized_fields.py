@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenant_data', '0008_batch_allocation_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseitem',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='purchase_items', to='tenant_data.product'),
+        ),
+        migrations.AddField(
+            model_name='purchaseitem',
+            name='purchased_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='salesitem',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='sales_items', to='tenant_data.product'),
+        ),
+        migrations.AddField(
+            model_name='salesitem',
+            name='sold_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
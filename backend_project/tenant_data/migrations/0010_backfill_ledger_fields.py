@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+from django.db import migrations, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+BACKFILL_CHUNK = 10000
+
+# (item model, parent field, item date field, parent date field)
+BACKFILLS = (
+    ('SalesItem', 'sale', 'sold_at', 'created_at'),
+    ('PurchaseItem', 'purchase', 'purchased_at', 'purchase_date'),
+)
+
+
+def backfill_ledger_fields(apps, schema_editor):
+    # One primary key range per transaction, so large tables are not locked
+    # or rewritten in a single statement.
+    Product_Batch = apps.get_model('tenant_data', 'Product_Batch')
+    alias = schema_editor.connection.alias
+    for model_name, parent, date_field, parent_date in BACKFILLS:
+        model = apps.get_model('tenant_data', model_name)
+        parent_model = model._meta.get_field(parent).related_model
+        last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        for low in range(0, last, BACKFILL_CHUNK):
+            with transaction.atomic(using=alias):
+                model.objects.filter(pk__gt=low, pk__lte=low + BACKFILL_CHUNK, product__isnull=True).update(
+                    product_id=Subquery(Product_Batch.objects.filter(pk=OuterRef('product_batch_id')).values('product_id')[:1]),
+                    **{date_field: Subquery(parent_model.objects.filter(pk=OuterRef(f'{parent}_id')).values(parent_date)[:1])},
+                )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('tenant_data', '0009_ledger_denormalized_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ledger_fields, migrations.RunPython.noop),
+    ]
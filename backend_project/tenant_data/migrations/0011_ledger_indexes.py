@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenant_data', '0010_backfill_ledger_fields'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product_batch',
+            index=models.Index(fields=['added_date', 'product'], include=('quantity', 'cost_rate', 'selling_rate'), name='batch_ledger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseitem',
+            index=models.Index(fields=['purchased_at', 'product'], include=('quantity', 'total_cost_price', 'total_selling_price'), name='purchaseitem_ledger_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesitem',
+            index=models.Index(fields=['sold_at', 'product'], include=('quantity', 'total_cost_price', 'total_selling_price'), name='salesitem_ledger_idx'),
+        ),
+    ]
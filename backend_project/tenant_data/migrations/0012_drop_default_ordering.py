@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenant_data', '0011_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='product_batch',
+            options={'verbose_name': 'Product Batch', 'verbose_name_plural': 'Product Batches'},
+        ),
+        migrations.AlterModelOptions(
+            name='salesitem',
+            options={'verbose_name': 'Sales Item', 'verbose_name_plural': 'Sales Items'},
+        ),
+    ]
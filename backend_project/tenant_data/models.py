@@ -1,6 +1,10 @@
+import threading
+
+from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
-from django.db.models import Count, F, Sum
+from django.db import connection, connections, models, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Upper
 from django.utils import timezone
 
 
@@ -12,31 +16,63 @@ class TenantData(models.Model):
     def __str__(self):
         return self.name
     
+class ProductQuerySet(models.QuerySet):
+    def with_stock_totals(self):
+        return self.annotate(
+            _batch_count=Count('product_batch'),
+            _total_quantity=Sum('product_batch__quantity'),
+            _total_cost_price=Sum('product_batch__total_cost_price'),
+            _total_selling_price=Sum('product_batch__total_selling_price'),
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=15)
     product_type = models.CharField(max_length=15, blank=True)
     expirable = models.BooleanField(default=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(Upper('name'), name='unique_product_name_ci'),
+        ]
     
     def __str__(self):
         return self.name
     
+    # The totals below read the annotations added by
+    # Product.objects.with_stock_totals() and only query when they are missing.
     def batch_count(self):
+        if hasattr(self, '_batch_count'):
+            return self._batch_count
         return self.product_batch_set.count()
     batch_count.short_description = "Number of Batches"
 
     def total_quantity(self):
+        if hasattr(self, '_total_quantity'):
+            return self._total_quantity or 0
         return self.product_batch_set.aggregate(total=Sum('quantity'))['total'] or 0
     total_quantity.short_description = "Total Quantity"
 
     def total_cost_value(self):
+        if hasattr(self, '_total_cost_price'):
+            return self._total_cost_price or 0
         return self.product_batch_set.aggregate(total=Sum('total_cost_price'))['total'] or 0
     total_cost_value.short_description = "Total Cost Value"
     
     def total_selling_value(self):
+        if hasattr(self, '_total_selling_price'):
+            return self._total_selling_price or 0
         return self.product_batch_set.aggregate(total=Sum('total_selling_price'))['total'] or 0
     total_selling_value.short_description = "Total Selling Value"
     
 
+# Rows covered by the case-insensitive batch number constraint. Lookups that
+# repeat this filter can use its partial index.
+HAS_BATCH_NUMBER = Q(batch_number__isnull=False) & ~Q(batch_number='')
+
+
 class Product_Batch(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     batch_number = models.CharField(max_length=50, null=True)
@@ -49,10 +85,12 @@ class Product_Batch(models.Model):
     total_cost_price = models.DecimalField(max_digits=12,decimal_places=2, blank=True, default=0)
     
     
-    def save(self, *args, **kwargs):
+    def set_totals(self):
         self.total_selling_price = self.quantity * self.selling_rate
         self.total_cost_price = self.quantity * self.cost_rate
 
+    def save(self, *args, **kwargs):
+        self.set_totals()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -61,9 +99,105 @@ class Product_Batch(models.Model):
     class Meta:
         verbose_name = "Product Batch"
         verbose_name_plural = "Product Batches"
-        ordering = ['-added_date']
+        constraints = [
+            models.UniqueConstraint(
+                Upper('batch_number'),
+                name='unique_batch_number_ci',
+                condition=HAS_BATCH_NUMBER,
+            ),
+        ]
+        indexes = [
+            # Covers the ledger's "batches added in a period, per product" sums.
+            models.Index(
+                fields=['added_date', 'product'],
+                include=['quantity', 'cost_rate', 'selling_rate'],
+                name='batch_ledger_idx',
+            ),
+            # In-stock batches of a product in allocation order, for sales by product.
+            models.Index(
+                fields=['product', 'expiry_date', 'added_date'],
+                condition=Q(quantity__gt=0),
+                name='batch_allocation_idx',
+            ),
+        ]
         
 
+class BillSequenceManager(models.Manager):
+    # Numbers reserved in blocks but not handed out yet, per (schema, name).
+    _blocks = {}
+    _lock = threading.Lock()
+    # Per-thread second connection that reserves blocks in autocommit mode.
+    _local = threading.local()
+
+    def _reserve(self, name, count, using=None):
+        using = using or connection
+        table = using.ops.quote_name(self.model._meta.db_table)
+        with using.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (name, last_value) VALUES (%s, %s) "
+                f"ON CONFLICT (name) DO UPDATE SET last_value = {table}.last_value + EXCLUDED.last_value "
+                f"RETURNING last_value",
+                [name, count],
+            )
+            return cursor.fetchone()[0]
+
+    def _block_connection(self):
+        # Reserving a block on the caller's connection would keep the counter
+        # row locked until the caller's transaction ends, serializing every
+        # concurrent bill in the tenant. On its own autocommit connection the
+        # row is locked for the one statement.
+        side = getattr(self._local, 'connection', None)
+        if side is None:
+            side = self._local.connection = connections.create_connection(connection.alias)
+        side.close_if_unusable_or_obsolete()
+        schema_name = getattr(connection, 'schema_name', None)
+        if schema_name and getattr(side, 'schema_name', None) != schema_name:
+            side.set_schema(schema_name)
+        return side
+
+    def next_value(self, name):
+        # With a block size of 1 the counter row is bumped inside the caller's
+        # transaction, so a rolled back insert gives its number back and the
+        # sequence stays gapless, at the cost of bills waiting on each other.
+        # Larger blocks are reserved and committed straight away on a second
+        # connection: numbers of rolled back bills become gaps, and nothing
+        # waits on the counter beyond the reserving statement.
+        size = getattr(settings, 'BILL_NO_BLOCK_SIZE', 1)
+        if size <= 1:
+            return self._reserve(name, 1)
+
+        key = (getattr(connection, 'schema_name', None), name)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block:
+                return block.pop(0)
+        last = self._reserve(name, size, using=self._block_connection())
+        first = last - size + 1
+        self._store(key, range(first + 1, last + 1))
+        return first
+
+    def next_values(self, name, count):
+        # A run of numbers for bills inserted in bulk, bypassing save().
+        if count <= 0:
+            return range(0)
+        last = self._reserve(name, count)
+        return range(last - count + 1, last + 1)
+
+    def _store(self, key, values):
+        with self._lock:
+            self._blocks.setdefault(key, []).extend(values)
+
+
+class BillSequence(models.Model):
+    name = models.CharField(max_length=30, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    objects = BillSequenceManager()
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+
 class PurchaseItem(models.Model):
     purchase = models.ForeignKey('Purchase', on_delete=models.CASCADE, related_name='items')
     product_batch = models.ForeignKey('Product_Batch', on_delete=models.PROTECT, related_name='purchase_items')
@@ -74,15 +208,34 @@ class PurchaseItem(models.Model):
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     total_selling_price = models.DecimalField(max_digits=12,decimal_places=2, blank=True, default=0)
     total_cost_price = models.DecimalField(max_digits=12,decimal_places=2, blank=True, default=0)
+    # Copies of product_batch.product and purchase.purchase_date, so the
+    # ledger can aggregate purchases without joining either table.
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, null=True, related_name='purchase_items')
+    purchased_at = models.DateTimeField(null=True, blank=True)
 
-    def save(self, *args, **kwargs):
+    def set_totals(self):
         self.total_selling_price = self.quantity * self.selling_rate
         self.total_cost_price = self.quantity * self.cost_rate
 
+    def set_ledger_fields(self):
+        self.product_id = self.product_batch.product_id
+        self.purchased_at = self.purchase.purchase_date
+
+    def save(self, *args, **kwargs):
+        self.set_totals()
+        self.set_ledger_fields()
         super().save(*args, **kwargs)
     class Meta:
         verbose_name = "Purchase Item"
         verbose_name_plural = "Purchase Items"
+        indexes = [
+            # Covers the ledger's purchase totals per product over a period.
+            models.Index(
+                fields=['purchased_at', 'product'],
+                include=['quantity', 'total_cost_price', 'total_selling_price'],
+                name='purchaseitem_ledger_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.product_name} – {self.batch_number} × {self.quantity}"
@@ -105,10 +258,12 @@ class Purchase(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.bill_no:
-            last = Purchase.objects.order_by('-id').first()
-            seq = (last.id + 1) if last else 1
-            self.bill_no = f"PUR-{seq:06d}"
+            self.bill_no = f"PUR-{BillSequence.objects.next_value('purchase'):06d}"
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if not adding:
+            # Keep the items' copy of the purchase date in step.
+            self.items.exclude(purchased_at=self.purchase_date).update(purchased_at=self.purchase_date)
 
 
 class Sale(models.Model):
@@ -131,9 +286,7 @@ class Sale(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.bill_no:
-            last = Sale.objects.order_by('-id').first()
-            seq = (last.id + 1) if last else 1
-            self.bill_no = f"SAL-{seq:06d}"
+            self.bill_no = f"SAL-{BillSequence.objects.next_value('sale'):06d}"
         super().save(*args, **kwargs)       
     
     
@@ -147,16 +300,51 @@ class SalesItem(models.Model):
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     total_selling_price = models.DecimalField(max_digits=12,decimal_places=2, blank=True, default=0)
     total_cost_price = models.DecimalField(max_digits=12,decimal_places=2, blank=True, default=0)
+    # Copies of product_batch.product and sale.created_at, so the ledger can
+    # aggregate sales without joining either table.
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, null=True, related_name='sales_items')
+    sold_at = models.DateTimeField(null=True, blank=True)
 
-    def save(self, *args, **kwargs):
+    def set_totals(self):
         self.total_selling_price = self.quantity * self.selling_rate
         self.total_cost_price = self.quantity * self.cost_rate
 
+    def set_ledger_fields(self):
+        self.product_id = self.product_batch.product_id
+        self.sold_at = self.sale.created_at
+
+    def save(self, *args, **kwargs):
+        self.set_totals()
+        self.set_ledger_fields()
         super().save(*args, **kwargs)
     class Meta:
         verbose_name = "Sales Item"
         verbose_name_plural = "Sales Items"
-        ordering = ['-sale__created_at']
+        indexes = [
+            # Covers the ledger's sales totals per product over a period.
+            models.Index(
+                fields=['sold_at', 'product'],
+                include=['quantity', 'total_cost_price', 'total_selling_price'],
+                name='salesitem_ledger_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} – {self.batch_number} × {self.quantity}"
+
+class StockSnapshot(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    cost_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    selling_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = "Stock Snapshot"
+        verbose_name_plural = "Stock Snapshots"
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'date'], name='unique_stock_snapshot_per_day'),
+        ]
 
     def __str__(self):
-        return f"{self.product_name} – {self.batch_number} × {self.quantity}"
\ No newline at end of file
+        return f"{self.product.name} @ {self.date}: {self.quantity}"
@@ -1,8 +1,32 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 from django.db.models.functions import Upper
-from django.http import JsonResponse
+from django.utils import timezone
 from rest_framework import serializers
 
+from .allocation import allocate, sellable
 from .models import *
+from .snapshots import refresh_stock_snapshots_on_commit
+
+BULK_BATCH_SIZE = 500
+
+PRODUCT_NAME_TAKEN = "A product with this name already exists."
+BATCH_NUMBER_TAKEN = "A batch with this batch number already exists."
+
+
+def line_items(bill):
+    # Listings prefetch the items already ordered by pk (see
+    # views.items_prefetch); order_by() here would bypass that prefetch.
+    if 'items' in getattr(bill, '_prefetched_objects_cache', {}):
+        return bill.items.all()
+    return bill.items.order_by('pk')
+
+
+def unique_violation(exc, constraint):
+    # psycopg reports the violated constraint in the error diagnostics.
+    return getattr(getattr(exc.__cause__, 'diag', None), 'constraint_name', None) == constraint
 
 
 class TenantDataSerializer(serializers.ModelSerializer):
@@ -32,13 +56,32 @@ class ProductSerializer(serializers.ModelSerializer):
         if not value:
             return value
         upper_value = value.upper()
-        qs = Product.objects.annotate(upper_name=Upper('name')).filter(upper_name=upper_value)
-        if self.instance:
-            qs = qs.exclude(pk=self.instance.pk)
-        if qs.exists():
-            return JsonResponse({"success": False, "message": "A product with this name already exists."},status=400)
+        # Bulk imports pass the upper-cased names already taken instead of
+        # querying once per row.
+        existing_names = self.context.get('existing_names')
+        if existing_names is not None:
+            taken = upper_value in existing_names
+        else:
+            # An index lookup on unique_product_name_ci.
+            qs = Product.objects.annotate(upper_name=Upper('name')).filter(upper_name=upper_value)
+            if self.instance:
+                qs = qs.exclude(pk=self.instance.pk)
+            taken = qs.exists()
+        if taken:
+            raise serializers.ValidationError(PRODUCT_NAME_TAKEN)
         return value
 
+    def save(self, **kwargs):
+        # The check above can race with a concurrent insert; the constraint
+        # settles it.
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as exc:
+            if unique_violation(exc, 'unique_product_name_ci'):
+                raise serializers.ValidationError({'name': [PRODUCT_NAME_TAKEN]})
+            raise
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         data['batch_count'] = instance.batch_count()
@@ -65,8 +108,8 @@ class ProductBatchSerializer(serializers.ModelSerializer):
 
         upper_batch = str(value).strip().upper()
 
-        queryset = Product_Batch.objects.exclude(batch_number__isnull=True) \
-                                        .exclude(batch_number__exact='') \
+        # Matches the partial index behind unique_batch_number_ci.
+        queryset = Product_Batch.objects.filter(HAS_BATCH_NUMBER) \
                                         .annotate(upper_batch=Upper('batch_number')) \
                                         .filter(upper_batch=upper_batch)
 
@@ -74,9 +117,7 @@ class ProductBatchSerializer(serializers.ModelSerializer):
             queryset = queryset.exclude(pk=self.instance.pk)
 
         if queryset.exists():
-            raise serializers.ValidationError(
-                "A batch with this batch number already exists."
-            )
+            raise serializers.ValidationError(BATCH_NUMBER_TAKEN)
         return value
 
     def validate(self, attrs):
@@ -90,6 +131,54 @@ class ProductBatchSerializer(serializers.ModelSerializer):
             )
         return attrs
 
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                batch = super().save(**kwargs)
+        except IntegrityError as exc:
+            if unique_violation(exc, 'unique_batch_number_ci'):
+                raise serializers.ValidationError({'batch_number': [BATCH_NUMBER_TAKEN]})
+            raise
+        return batch
+
+
+class BatchImportSerializer(serializers.Serializer):
+    # One row of a batch import. The product is given by id or by name and is
+    # resolved against context['products'] ({id: expirable}) and
+    # context['product_names'] ({upper-cased name: id}); batch numbers are
+    # checked against context['batch_numbers'], a set of upper-cased numbers.
+    product_id = serializers.IntegerField(required=False)
+    product_name = serializers.CharField(max_length=15, required=False)
+    batch_number = serializers.CharField(max_length=50, required=False, allow_blank=True, allow_null=True)
+    expiry_date = serializers.DateTimeField(required=False, allow_null=True)
+    quantity = serializers.IntegerField(min_value=0)
+    cost_rate = serializers.DecimalField(max_digits=10, decimal_places=2)
+    selling_rate = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+    def validate_batch_number(self, value):
+        value = (value or '').strip()
+        if value and value.upper() in self.context['batch_numbers']:
+            raise serializers.ValidationError(BATCH_NUMBER_TAKEN)
+        return value or None
+
+    def validate(self, data):
+        product_id = data.get('product_id')
+        if product_id is None and data.get('product_name'):
+            product_id = self.context['product_names'].get(data['product_name'].upper())
+        if product_id is None or product_id not in self.context['products']:
+            raise serializers.ValidationError("Unknown product; give an existing product_id or product_name.")
+        data['product_id'] = product_id
+        data.pop('product_name', None)
+        if self.context['products'][product_id]:
+            if not data.get('batch_number'):
+                raise serializers.ValidationError({"batch_number": "This field is required for expirable products."})
+            if data.get('expiry_date') is None:
+                raise serializers.ValidationError({"expiry_date": "This field is required for expirable products."})
+        expiry = data.get('expiry_date')
+        if expiry and expiry <= timezone.now():
+            raise serializers.ValidationError("Expiry date must be after the added date.")
+        return data
+
 
 class PurchaseItemCreateSerializer(serializers.Serializer):
     batch_number = serializers.CharField(max_length=50, required=False, allow_blank=True, allow_null=True)
@@ -103,9 +192,12 @@ class PurchaseItemCreateSerializer(serializers.Serializer):
         product_id = data.get('product_id')
         if product_id is None:
             raise serializers.ValidationError("product_id is required")
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+        products = self.context.get('products')
+        if products is not None:
+            product = products.get(product_id)
+        else:
+            product = Product.objects.filter(id=product_id).first()
+        if product is None:
             raise serializers.ValidationError("Invalid product_id")
         if product.expirable:
             if 'batch_number' not in data or not data['batch_number']:
@@ -129,44 +221,109 @@ class PurchaseSerializer(serializers.ModelSerializer):
         model = Purchase
         fields = ['bill_no', 'supplier_name', 'purchase_date', 'total_amount', 'notes', 'items']
 
+    def to_internal_value(self, data):
+        # Load every referenced product once for the item validators and create().
+        items = data.get('items') if hasattr(data, 'get') else None
+        product_ids = set()
+        for item in items if isinstance(items, list) else []:
+            try:
+                product_ids.add(int(item.get('product_id')))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        self.context['products'] = Product.objects.in_bulk(product_ids)
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        # Every item becomes a new batch, so its number must not be in use;
+        # the whole bill is checked with one indexed query.
+        counts = defaultdict(int)
+        for item in attrs.get('items', []):
+            if item.get('batch_number'):
+                counts[item['batch_number'].strip().upper()] += 1
+        taken = {number for number, count in counts.items() if count > 1}
+        if counts:
+            taken.update(
+                Product_Batch.objects.filter(HAS_BATCH_NUMBER)
+                                     .annotate(upper_batch=Upper('batch_number'))
+                                     .filter(upper_batch__in=list(counts))
+                                     .values_list('upper_batch', flat=True)
+            )
+        if taken:
+            raise serializers.ValidationError({'items': [f"{BATCH_NUMBER_TAKEN} ({', '.join(sorted(taken))})"]})
+        return attrs
+
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        except IntegrityError as exc:
+            if unique_violation(exc, 'unique_batch_number_ci'):
+                raise serializers.ValidationError({'items': [BATCH_NUMBER_TAKEN]})
+            raise
+
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        validated_data.pop('total_amount', None) 
-        purchase = Purchase.objects.create(**validated_data)
-        total = 0
+        validated_data.pop('total_amount', None)
+        products = self.context.get('products') or Product.objects.in_bulk(
+            {item['product_id'] for item in items_data}
+        )
+
+        batches = []
         for item_data in items_data:
-            product = Product.objects.get(id=item_data['product_id'])
-            batch = Product_Batch.objects.create(
-                product=product,
+            batch = Product_Batch(
+                product=products[item_data['product_id']],
                 batch_number=item_data['batch_number'],
                 expiry_date=item_data['expiry_date'],
                 quantity=item_data['quantity'],
                 selling_rate=item_data['selling_rate'],
                 cost_rate=item_data['cost_rate'],
             )
-            purchase_item = PurchaseItem.objects.create(
-                purchase=purchase,
+            batch.set_totals()
+            batches.append(batch)
+        Product_Batch.objects.bulk_create(batches, batch_size=BULK_BATCH_SIZE)
+
+        items = []
+        for batch in batches:
+            item = PurchaseItem(
                 product_batch=batch,
-                product_name=product.name,
+                product_name=batch.product.name,
                 batch_number=batch.batch_number,
-                cost_rate=item_data['cost_rate'],
-                selling_rate=item_data['selling_rate'],
-                quantity=item_data['quantity'],
+                cost_rate=batch.cost_rate,
+                selling_rate=batch.selling_rate,
+                quantity=batch.quantity,
             )
-            total += purchase_item.total_cost_price
-        purchase.total_amount = total
-        purchase.save()
+            item.set_totals()
+            items.append(item)
+
+        purchase = Purchase.objects.create(
+            total_amount=sum(item.total_cost_price for item in items),
+            **validated_data,
+        )
+        for item in items:
+            item.purchase = purchase
+            item.set_ledger_fields()
+        PurchaseItem.objects.bulk_create(items, batch_size=BULK_BATCH_SIZE)
+        refresh_stock_snapshots_on_commit(batch.product_id for batch in batches)
         return purchase
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
-        ret['items'] = PurchaseItemSerializer(instance.items.all(), many=True).data
+        if self.context.get('include_items', True):
+            ret['items'] = PurchaseItemSerializer(line_items(instance), many=True).data
         return ret
 
 class SalesItemCreateSerializer(serializers.Serializer):
-    batch_id = serializers.IntegerField()
+    # A line names either a batch or a product; product lines are split
+    # across that product's batches, first expiry first out.
+    batch_id = serializers.IntegerField(required=False)
+    product_id = serializers.IntegerField(required=False)
     quantity = serializers.IntegerField(min_value=1)
 
+    def validate(self, data):
+        if ('batch_id' in data) == ('product_id' in data):
+            raise serializers.ValidationError("Give either batch_id or product_id.")
+        return data
+
 class SalesItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = SalesItem
@@ -183,52 +340,100 @@ class SaleSerializer(serializers.ModelSerializer):
             'quantity': {'read_only': True}
         }
 
+    @transaction.atomic
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        sale = Sale.objects.create(quantity=0, **validated_data)
-        total_amount = 0
-        total_quantity = 0
-        for item_data in items_data:
-            try:
-                batch = Product_Batch.objects.get(id=item_data['batch_id'])
-                product = batch.product
 
-            except Product_Batch.DoesNotExist:
+        batch_ids = {item_data['batch_id'] for item_data in items_data if 'batch_id' in item_data}
+        product_ids = {item_data['product_id'] for item_data in items_data if 'product_id' in item_data}
+
+        # Lock every batch the bill can draw from in one query, in primary key
+        # order so concurrent sales touching the same batches cannot deadlock.
+        # Product lines read their in-stock batches through
+        # batch_allocation_idx.
+        lookup = Q()
+        if batch_ids:
+            lookup |= Q(pk__in=batch_ids)
+        if product_ids:
+            lookup |= Q(product_id__in=product_ids, quantity__gt=0)
+        batches = Product_Batch.objects.select_for_update(of=('self',)) \
+                                       .select_related('product') \
+                                       .filter(lookup) \
+                                       .order_by('pk') \
+                                       .in_bulk()
+
+        # Lines naming a batch are reserved before product lines are
+        # allocated, so a product line never takes stock a later line asked
+        # for by batch. The sale's items still follow the request's order,
+        # each product line expanded in place.
+        remaining = {batch.pk: batch.quantity for batch in batches.values()}
+        allocated = [None] * len(items_data)
+        for index, item_data in enumerate(items_data):
+            if 'batch_id' not in item_data:
+                continue
+            batch = batches.get(item_data['batch_id'])
+            if batch is None:
                 raise serializers.ValidationError(f"Batch with id {item_data['batch_id']} does not exist.")
-            if item_data['quantity'] > batch.quantity:
-                raise serializers.ValidationError(f"Insufficient quantity in batch {item_data['batch_id']}. Available: {batch.quantity}")            
-            if not product.expirable:
-                print(f"if run{batch.id}")
-                sales_item = SalesItem.objects.create(
-                    sale=sale,
-                    product_batch=batch,
-                    product_name=batch.product.name,
-                    batch_number=None,
-                    cost_rate=batch.cost_rate,
-                    selling_rate=batch.selling_rate,
-                    quantity=item_data['quantity'],
-                )
-            else:
-                print( f"else run{batch.id}")
-                sales_item = SalesItem.objects.create(
-                    sale=sale,
-                    product_batch=batch,
-                    product_name=batch.product.name,
-                    batch_number=batch.batch_number,
-                    cost_rate=batch.cost_rate,
-                    selling_rate=batch.selling_rate,
-                    quantity=item_data['quantity'],
-                )
-            total_amount += sales_item.total_selling_price
-            total_quantity += sales_item.quantity
-            batch.quantity -= sales_item.quantity
-            batch.save()
-        sale.total_amount = total_amount
-        sale.quantity = total_quantity
-        sale.save()
+            remaining[batch.pk] -= item_data['quantity']
+            if remaining[batch.pk] < 0:
+                raise serializers.ValidationError(f"Insufficient quantity in batch {item_data['batch_id']}. Available: {batch.quantity}")
+            allocated[index] = [(batch, item_data['quantity'])]
+
+        now = timezone.now()
+        candidates = defaultdict(list)
+        for batch in batches.values():
+            if batch.product_id in product_ids and sellable(batch, now):
+                candidates[batch.product_id].append(batch)
+        for index, item_data in enumerate(items_data):
+            if 'product_id' not in item_data:
+                continue
+            allocations = allocate(candidates[item_data['product_id']], item_data['quantity'], remaining)
+            if allocations is None:
+                available = sum(remaining[batch.pk] for batch in candidates[item_data['product_id']])
+                raise serializers.ValidationError(f"Insufficient quantity for product {item_data['product_id']}. Available: {available}")
+            allocated[index] = allocations
+        lines = [line for allocations in allocated for line in allocations]
+
+        requested = defaultdict(int)
+        sales_items = []
+        for batch, quantity in lines:
+            requested[batch.pk] += quantity
+            sales_item = SalesItem(
+                product_batch=batch,
+                product_name=batch.product.name,
+                batch_number=batch.batch_number if batch.product.expirable else None,
+                cost_rate=batch.cost_rate,
+                selling_rate=batch.selling_rate,
+                quantity=quantity,
+            )
+            sales_item.set_totals()
+            sales_items.append(sales_item)
+
+        sale = Sale.objects.create(
+            total_amount=sum(item.total_selling_price for item in sales_items),
+            quantity=sum(item.quantity for item in sales_items),
+            **validated_data,
+        )
+        for sales_item in sales_items:
+            sales_item.sale = sale
+            sales_item.set_ledger_fields()
+        SalesItem.objects.bulk_create(sales_items, batch_size=BULK_BATCH_SIZE)
+
+        for batch_id, quantity in requested.items():
+            batch = batches[batch_id]
+            batch.quantity = F('quantity') - quantity
+            batch.total_selling_price = (F('quantity') - quantity) * F('selling_rate')
+            batch.total_cost_price = (F('quantity') - quantity) * F('cost_rate')
+        Product_Batch.objects.bulk_update(
+            [batches[batch_id] for batch_id in requested],
+            ['quantity', 'total_selling_price', 'total_cost_price'],
+            batch_size=BULK_BATCH_SIZE,
+        )
+        refresh_stock_snapshots_on_commit(batches[batch_id].product_id for batch_id in requested)
         return sale
 
     def to_representation(self, instance):
         ret = super().to_representation(instance)
-        ret['items'] = SalesItemSerializer(instance.items.all(), many=True).data
+        if self.context.get('include_items', True):
+            ret['items'] = SalesItemSerializer(line_items(instance), many=True).data
         return ret
\ No newline at end of file
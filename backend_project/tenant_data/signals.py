@@ -0,0 +1,65 @@
+# tenant_data/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import invalidate_ledger_cache
+from .ledger import day_start
+from .models import Product, Product_Batch, Purchase, PurchaseItem, Sale, SalesItem
+from .snapshots import discard_stock_snapshots_on_commit
+
+# Bulk writes (bulk_create / bulk_update) do not send these signals; the sale
+# and purchase serializers always save the parent Sale / Purchase, which does.
+
+
+def _invalidate_on_commit(history):
+    transaction.on_commit(lambda: invalidate_ledger_cache(history=history))
+
+
+def _backdated(purchase):
+    return purchase.purchase_date is not None and purchase.purchase_date < day_start(timezone.localdate())
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_save, sender=SalesItem)
+@receiver(post_save, sender=Product_Batch)
+def invalidate_ledger_on_stock_save(sender, instance, created, **kwargs):
+    _invalidate_on_commit(history=not created)
+
+
+@receiver(post_save, sender=Purchase)
+def invalidate_ledger_on_purchase_save(sender, instance, created, **kwargs):
+    _invalidate_on_commit(history=not created or _backdated(instance))
+
+
+@receiver(post_save, sender=PurchaseItem)
+def invalidate_ledger_on_purchase_item_save(sender, instance, created, **kwargs):
+    _invalidate_on_commit(history=not created or _backdated(instance.purchase))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Sale)
+@receiver(post_delete, sender=SalesItem)
+@receiver(post_delete, sender=Purchase)
+@receiver(post_delete, sender=PurchaseItem)
+@receiver(post_delete, sender=Product_Batch)
+def invalidate_ledger_history(sender, instance, **kwargs):
+    _invalidate_on_commit(history=True)
+
+
+# The ledger replays a batch from its current quantity, so editing or
+# deleting one (from the API or the admin) changes its stock back to the day
+# it was added; so does deleting a line sold from it.
+@receiver(post_save, sender=Product_Batch)
+@receiver(post_delete, sender=Product_Batch)
+def discard_snapshots_on_batch_change(sender, instance, **kwargs):
+    discard_stock_snapshots_on_commit([instance.product_id], timezone.localdate(instance.added_date))
+
+
+@receiver(post_delete, sender=SalesItem)
+def discard_snapshots_on_sales_item_delete(sender, instance, **kwargs):
+    batch = Product_Batch.objects.filter(pk=instance.product_batch_id).values_list('product', 'added_date').first()
+    if batch:
+        discard_stock_snapshots_on_commit([batch[0]], timezone.localdate(batch[1]))
@@ -0,0 +1,89 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .ledger import ZERO, day_start, nearest_snapshots, stock_at, value_sum
+from .models import Product, Product_Batch, StockSnapshot
+
+SNAPSHOT_FIELDS = ['quantity', 'cost_value', 'selling_value']
+
+
+def _snapshot(product_id, day, stock):
+    return StockSnapshot(
+        product_id=product_id,
+        date=day,
+        quantity=stock.get('qty') or 0,
+        cost_value=stock.get('cost') or ZERO,
+        selling_value=stock.get('selling') or ZERO,
+    )
+
+
+def _save_snapshots(snapshots):
+    StockSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['product', 'date'],
+        update_fields=SNAPSHOT_FIELDS,
+    )
+
+
+def _values(stock):
+    return stock.get('qty') or 0, stock.get('cost') or ZERO, stock.get('selling') or ZERO
+
+
+def build_snapshot(day):
+    # A product only gets a row on days its stock changed, or when it has no
+    # earlier row; readers carry its latest earlier row forward.
+    previous = nearest_snapshots(day - datetime.timedelta(days=1))
+    stock = stock_at(day_start(day + datetime.timedelta(days=1)))
+    product_ids = [
+        pk for pk in Product.objects.values_list('pk', flat=True)
+        if pk not in previous or _values(stock.get(pk, {})) != _values(previous[pk])
+    ]
+    snapshots = [_snapshot(pk, day, stock.get(pk, {})) for pk in product_ids]
+    _save_snapshots(snapshots)
+    return len(snapshots)
+
+
+def refresh_stock_snapshots(product_ids):
+    # Called once sales or purchases commit: with nothing later in the day yet,
+    # today's snapshot is simply the stock currently held in the batches.
+    # Tenants that never built snapshots are left alone.
+    product_ids = set(product_ids)
+    if not product_ids or not StockSnapshot.objects.exists():
+        return
+    current = {
+        row.pop('product'): row
+        for row in Product_Batch.objects.order_by().filter(product_id__in=product_ids).values('product').annotate(
+            qty=Sum('quantity'),
+            cost=value_sum('quantity', 'cost_rate'),
+            selling=value_sum('quantity', 'selling_rate'),
+        )
+    }
+    today = timezone.localdate()
+    _save_snapshots([_snapshot(pk, today, current.get(pk, {})) for pk in product_ids])
+
+
+def refresh_stock_snapshots_on_commit(product_ids):
+    product_ids = set(product_ids)
+    transaction.on_commit(lambda: refresh_stock_snapshots(product_ids))
+
+
+def discard_stock_snapshots(product_ids, since):
+    # For changes to stock already held on ``since`` (an edited or deleted
+    # batch, a deleted sale line): later rows no longer match the batches, so
+    # readers fall back to an earlier row or replay. Today's row is rewritten.
+    # Signals call this for single saves and deletes; bulk writes that date
+    # batches or sales in the past must call it themselves.
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    StockSnapshot.objects.filter(product_id__in=product_ids, date__gte=since).delete()
+    refresh_stock_snapshots(product_ids)
+
+
+def discard_stock_snapshots_on_commit(product_ids, since):
+    product_ids = set(product_ids)
+    transaction.on_commit(lambda: discard_stock_snapshots(product_ids, since))
@@ -0,0 +1,134 @@
+import csv
+import datetime
+import json
+import tempfile
+from collections.abc import Iterator
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import openpyxl
+except ImportError:  # xlsx exports are optional
+    openpyxl = None
+
+TRUTHY = ('1', 'true', 'yes', 'on')
+# Rows fetched per round trip by the server-side cursors behind exports.
+EXPORT_CHUNK_SIZE = 2000
+XLSX_READ_SIZE = 64 * 1024
+
+
+def wants_stream(request):
+    return request.query_params.get('stream', '').lower() in TRUTHY
+
+
+def _dumps(value):
+    return json.dumps(value, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+
+
+def iter_json(value):
+    # Iterators are written out as arrays one element at a time and dicts are
+    # walked so nested iterators stream too; everything else is encoded whole.
+    if isinstance(value, Iterator):
+        yield '['
+        for i, item in enumerate(value):
+            yield (',' if i else '') + _dumps(item)
+        yield ']'
+    elif isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield (',' if i else '') + _dumps(key) + ':'
+            yield from iter_json(item)
+        yield '}'
+    else:
+        yield _dumps(value)
+
+
+def json_stream_response(payload, status=200):
+    return StreamingHttpResponse(
+        (chunk.encode('utf-8') for chunk in iter_json(payload)),
+        status=status,
+        content_type='application/json',
+    )
+
+
+class ExportRenderer(BaseRenderer):
+    # Only lets ?format=csv / ?format=xlsx (or the matching Accept header)
+    # through content negotiation; export views return their own streaming
+    # response. Anything else rendered with it, such as an error, is JSON.
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return JSONRenderer().render(data)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class XLSXRenderer(ExportRenderer):
+    media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    format = 'xlsx'
+
+
+EXPORT_RENDERERS = (CSVRenderer, XLSXRenderer)
+
+
+def export_format(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer.format if isinstance(renderer, ExportRenderer) else None
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _xlsx_cell(value):
+    # Excel has no time zones.
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+def iter_xlsx(header, rows):
+    # A write-only workbook spools rows to disk as they are appended; the
+    # zip container can only be sent once it is complete.
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append([_xlsx_cell(value) for value in row])
+    with tempfile.TemporaryFile() as handle:
+        workbook.save(handle)
+        handle.seek(0)
+        while chunk := handle.read(XLSX_READ_SIZE):
+            yield chunk
+
+
+def export_response(fmt, filename, header, rows):
+    if fmt == 'xlsx':
+        if openpyxl is None:
+            return Response({"success": False, "message": "xlsx export requires openpyxl to be installed."},
+                            status=status.HTTP_406_NOT_ACCEPTABLE)
+        response = StreamingHttpResponse(iter_xlsx(header, rows), content_type=XLSXRenderer.media_type)
+    else:
+        response = StreamingHttpResponse(
+            (line.encode('utf-8') for line in iter_csv(header, rows)),
+            content_type='text/csv; charset=utf-8',
+        )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
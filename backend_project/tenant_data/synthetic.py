@@ -0,0 +1,416 @@
+import bisect
+import csv
+import datetime
+import heapq
+import io
+import math
+import random
+from decimal import Decimal
+from itertools import accumulate
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import invalidate_ledger_cache
+from .models import BillSequence, Product, Product_Batch, Purchase, PurchaseItem, Sale, SalesItem
+from .serializers import BULK_BATCH_SIZE
+from .snapshots import build_snapshot, discard_stock_snapshots_on_commit
+
+CENT = Decimal('0.01')
+MARKUP = Decimal('1.25')
+
+# Shape of the data written by generate_tenant_data.
+COPY_FLUSH_ROWS = 50000
+BILL_NUMBER_BLOCK = 10000
+PRODUCT_TYPES = ('tablet', 'syrup', 'capsule', 'injection', 'ointment', 'drops', 'device', 'general')
+EXPIRABLE_SHARE = 0.7
+POPULARITY_EXPONENT = 1.1        # Zipf-like: a few products sell most of the units
+WEEKDAY_TRADE = (0.9, 0.9, 0.95, 1.0, 1.1, 1.35, 1.2)
+YEARLY_GROWTH = 0.15
+PURCHASE_QUANTITY = (20, 400)
+SHELF_LIFE_DAYS = (120, 900)
+COPY_NULL = r'\N'
+SNAPSHOT_INTERVAL_DAYS = 30
+
+
+def _set_dates(objects, field, values, batch_size):
+    # auto_now_add fields ignore the value given to bulk_create, so the
+    # generated dates are written back afterwards.
+    for obj, value in zip(objects, values):
+        setattr(obj, field, value)
+    type(objects[0]).objects.bulk_update(objects, [field], batch_size=batch_size)
+
+
+@transaction.atomic
+def seed_tenant_data(products=100, purchases=50, sales=200, items_per_bill=5, days=90,
+                     seed=0, name_prefix='P', batch_size=BULK_BATCH_SIZE):
+    """Fill the current tenant schema with consistent synthetic data.
+
+    Each purchase bill adds ``items_per_bill`` batches; each sale draws up to
+    ``items_per_bill`` lines from batches added before it, and batch
+    quantities are left at what remains. Dates are spread over the last
+    ``days`` days. Everything is written with bulk_create, a few statements
+    per table. Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - datetime.timedelta(days=days)
+
+    def moment():
+        return start + datetime.timedelta(seconds=rng.uniform(0, days * 86400))
+
+    product_rows = Product.objects.bulk_create(
+        [Product(name=f'{name_prefix}{i:06d}', product_type='synthetic', expirable=i % 2 == 0)
+         for i in range(products)],
+        batch_size=batch_size,
+    )
+
+    purchase_times = sorted(moment() for _ in range(purchases))
+    batches, added = [], []
+    for when in purchase_times:
+        for _ in range(items_per_bill):
+            product = rng.choice(product_rows)
+            cost_rate = (Decimal(rng.randint(100, 10000)) / 100).quantize(CENT)
+            batches.append(Product_Batch(
+                product=product,
+                batch_number=f'{name_prefix}-{len(batches):08d}' if product.expirable else None,
+                expiry_date=when + datetime.timedelta(days=rng.randint(180, 720)) if product.expirable else None,
+                quantity=rng.randint(10, 500),
+                cost_rate=cost_rate,
+                selling_rate=(cost_rate * MARKUP).quantize(CENT),
+            ))
+            added.append(when)
+    purchased = [batch.quantity for batch in batches]
+
+    sale_times = sorted(moment() for _ in range(sales))
+    sale_dates, sale_lines = [], []
+    for when in sale_times:
+        # Batches are in purchase order, so those already added form a prefix.
+        available = bisect.bisect_right(purchase_times, when) * items_per_bill
+        lines = {}
+        for _ in range(items_per_bill if available else 0):
+            batch = batches[rng.randrange(available)]
+            quantity = min(batch.quantity, rng.randint(1, 5))
+            if quantity and id(batch) not in lines:
+                batch.quantity -= quantity
+                lines[id(batch)] = (batch, quantity)
+        if lines:
+            sale_dates.append(when)
+            sale_lines.append(list(lines.values()))
+
+    for batch in batches:
+        batch.set_totals()
+    Product_Batch.objects.bulk_create(batches, batch_size=batch_size)
+    if batches:
+        _set_dates(batches, 'added_date', added, batch_size)
+
+    purchase_objects, purchase_items = [], []
+    bill_numbers = BillSequence.objects.next_values('purchase', len(purchase_times))
+    for index, (number, when) in enumerate(zip(bill_numbers, purchase_times)):
+        purchase = Purchase(bill_no=f"PUR-{number:06d}", supplier_name=f'Supplier {index % 50}', purchase_date=when)
+        items = []
+        for offset in range(index * items_per_bill, (index + 1) * items_per_bill):
+            batch = batches[offset]
+            item = PurchaseItem(
+                purchase=purchase,
+                product_batch=batch,
+                product_id=batch.product_id,
+                product_name=batch.product.name,
+                batch_number=batch.batch_number,
+                cost_rate=batch.cost_rate,
+                selling_rate=batch.selling_rate,
+                quantity=purchased[offset],
+                purchased_at=when,
+            )
+            item.set_totals()
+            items.append(item)
+        purchase.total_amount = sum(item.total_cost_price for item in items)
+        purchase_objects.append(purchase)
+        purchase_items.extend(items)
+    Purchase.objects.bulk_create(purchase_objects, batch_size=batch_size)
+    if purchase_objects:
+        _set_dates(purchase_objects, 'created_at', purchase_times, batch_size)
+    PurchaseItem.objects.bulk_create(purchase_items, batch_size=batch_size)
+
+    sale_objects, sales_items = [], []
+    bill_numbers = BillSequence.objects.next_values('sale', len(sale_dates))
+    for index, (number, when, lines) in enumerate(zip(bill_numbers, sale_dates, sale_lines)):
+        sale = Sale(bill_no=f"SAL-{number:06d}", customer_name=f'Customer {index % 200}')
+        items = []
+        for batch, quantity in lines:
+            item = SalesItem(
+                sale=sale,
+                product_batch=batch,
+                product_id=batch.product_id,
+                product_name=batch.product.name,
+                batch_number=batch.batch_number if batch.product.expirable else None,
+                cost_rate=batch.cost_rate,
+                selling_rate=batch.selling_rate,
+                quantity=quantity,
+                sold_at=when,
+            )
+            item.set_totals()
+            items.append(item)
+        sale.total_amount = sum(item.total_selling_price for item in items)
+        sale.quantity = sum(item.quantity for item in items)
+        sale_objects.append(sale)
+        sales_items.extend(items)
+    Sale.objects.bulk_create(sale_objects, batch_size=batch_size)
+    if sale_objects:
+        _set_dates(sale_objects, 'created_at', sale_dates, batch_size)
+    SalesItem.objects.bulk_create(sales_items, batch_size=batch_size)
+
+    # bulk_create sends no signals, so neither the ledger cache nor the stock
+    # snapshots are told; the generated batches are backdated to ``start``.
+    transaction.on_commit(lambda: invalidate_ledger_cache(history=True))
+    discard_stock_snapshots_on_commit([product.pk for product in product_rows], timezone.localdate(start))
+    return {
+        'products': len(product_rows),
+        'batches': len(batches),
+        'purchases': len(purchase_objects),
+        'purchase_items': len(purchase_items),
+        'sales': len(sale_objects),
+        'sales_items': len(sales_items),
+    }
+
+
+def _poisson(rng, mean):
+    if mean <= 0:
+        return 0
+    if mean > 30:
+        return max(0, round(rng.gauss(mean, math.sqrt(mean))))
+    limit, count, product = math.exp(-mean), 0, rng.random()
+    while product > limit:
+        count += 1
+        product *= rng.random()
+    return count
+
+
+def _moments(rng, day, count, opens, closes):
+    return sorted(day + datetime.timedelta(hours=rng.uniform(opens, closes)) for _ in range(count))
+
+
+def _bill_numbers(name):
+    while True:
+        yield from BillSequence.objects.next_values(name, BILL_NUMBER_BLOCK)
+
+
+def _pick_batch(batches, when):
+    # ``batches`` is a heap in allocation order (first expiry first out, as
+    # allocate() does), so spent and expired batches surface at the top and
+    # are dropped for good.
+    while batches:
+        batch = batches[0][1]
+        if batch[1] > 0 and (batch[5] is None or batch[5] > when):
+            return batch
+        heapq.heappop(batches)
+    return None
+
+
+class _CopyTable:
+    """Rows for one table, buffered as CSV and written with COPY.
+
+    Ids are taken from the table's sequence up front so children can point at
+    parents before either is written; ``parents`` are flushed first so the
+    foreign keys hold after every chunk.
+    """
+
+    def __init__(self, model, fields, parents=(), flush_rows=COPY_FLUSH_ROWS):
+        opts = model._meta
+        quote = connection.ops.quote_name
+        columns = ', '.join(quote(opts.get_field(name).column) for name in fields)
+        self.table = opts.db_table
+        self.sql = f"COPY {quote(self.table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+        self.parents = parents
+        self.flush_rows = flush_rows
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+        self.pending = self.written = 0
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [self.table])
+            self.first_id = self.next_id = cursor.fetchone()[0]
+
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def add(self, row):
+        self.writer.writerow([COPY_NULL if value is None else value for value in row])
+        self.pending += 1
+        if self.pending >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        for parent in self.parents:
+            parent.flush()
+        if not self.pending:
+            return
+        self.buffer.seek(0)
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(self.sql, self.buffer)
+            else:
+                # psycopg 3
+                with raw.copy(self.sql) as copy:
+                    copy.write(self.buffer.getvalue())
+        self.written += self.pending
+        self.pending = 0
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def finish(self):
+        self.flush()
+        if self.next_id > self.first_id:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [self.table, self.next_id - 1])
+
+
+def _settle_batches(first_batch_id):
+    # Batches are written with what was bought; take off what was sold in one
+    # statement rather than tracking every batch until the end.
+    batch = connection.ops.quote_name(Product_Batch._meta.db_table)
+    item = connection.ops.quote_name(SalesItem._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {batch} AS b SET quantity = b.quantity - s.sold, "
+            f"total_selling_price = (b.quantity - s.sold) * b.selling_rate, "
+            f"total_cost_price = (b.quantity - s.sold) * b.cost_rate "
+            f"FROM (SELECT product_batch_id, SUM(quantity) AS sold FROM {item} "
+            f"WHERE product_batch_id >= %s GROUP BY product_batch_id) AS s "
+            f"WHERE b.id = s.product_batch_id",
+            [first_batch_id],
+        )
+
+
+def generate_tenant_data(products=1000, days=730, purchases_per_day=4, sales_per_day=300,
+                         items_per_bill=8, seed=0, flush_rows=COPY_FLUSH_ROWS):
+    """Stream ``days`` of trade into the current tenant schema with COPY.
+
+    Products sell with Zipf-like popularity, trade is busier at weekends and
+    grows over the period, purchases arrive before opening and sales take
+    batches first expiry first out. Only the open batches are held in memory,
+    so the volume is bounded by time rather than memory. Rows are written in
+    autocommitted chunks, so nothing else should write to the schema while
+    this runs. Stock snapshots are built over the period afterwards. Returns
+    the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = today - datetime.timedelta(days=days)
+
+    product_table = _CopyTable(Product, ['id', 'name', 'product_type', 'expirable'], flush_rows=flush_rows)
+    batch_table = _CopyTable(Product_Batch, [
+        'id', 'product', 'batch_number', 'added_date', 'expiry_date', 'quantity',
+        'selling_rate', 'cost_rate', 'total_selling_price', 'total_cost_price',
+    ], parents=[product_table], flush_rows=flush_rows)
+    purchase_table = _CopyTable(Purchase, [
+        'id', 'bill_no', 'supplier_name', 'purchase_date', 'total_amount', 'notes', 'created_at', 'updated_at',
+    ], flush_rows=flush_rows)
+    purchase_item_table = _CopyTable(PurchaseItem, [
+        'id', 'purchase', 'product_batch', 'product', 'product_name', 'batch_number', 'cost_rate',
+        'selling_rate', 'quantity', 'total_selling_price', 'total_cost_price', 'purchased_at',
+    ], parents=[purchase_table, batch_table], flush_rows=flush_rows)
+    sale_table = _CopyTable(Sale, [
+        'id', 'bill_no', 'customer_name', 'quantity', 'total_amount', 'notes', 'created_at', 'updated_at',
+    ], flush_rows=flush_rows)
+    sales_item_table = _CopyTable(SalesItem, [
+        'id', 'sale', 'product_batch', 'product', 'product_name', 'batch_number', 'cost_rate',
+        'selling_rate', 'quantity', 'total_selling_price', 'total_cost_price', 'sold_at',
+    ], parents=[sale_table, batch_table], flush_rows=flush_rows)
+    first_batch_id = batch_table.first_id
+
+    catalog = []
+    for _ in range(products):
+        pk = product_table.new_id()
+        name = f'SKU{pk:08d}'
+        expirable = rng.random() < EXPIRABLE_SHARE
+        product_table.add((pk, name, rng.choice(PRODUCT_TYPES), expirable))
+        catalog.append((pk, name, expirable, rng.lognormvariate(3, 1)))
+    popularity = list(accumulate(1 / rank ** POPULARITY_EXPONENT for rank in range(1, products + 1)))
+    open_batches = {}
+    purchase_numbers, sale_numbers = _bill_numbers('purchase'), _bill_numbers('sale')
+
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        trade = WEEKDAY_TRADE[day.weekday()] * (1 + YEARLY_GROWTH * offset / 365)
+
+        for when in _moments(rng, day, _poisson(rng, purchases_per_day * trade), 6, 9):
+            purchase_id = purchase_table.new_id()
+            lines = rng.randint(1, items_per_bill)
+            items, total = [], Decimal(0)
+            for pk, name, expirable, base_cost in dict.fromkeys(rng.choices(catalog, cum_weights=popularity, k=lines)):
+                batch_id = batch_table.new_id()
+                quantity = rng.randint(*PURCHASE_QUANTITY)
+                cost_rate = Decimal(f'{max(base_cost * rng.uniform(0.9, 1.1), 0.5):.2f}')
+                selling_rate = (cost_rate * Decimal(f'{rng.uniform(1.1, 1.6):.2f}')).quantize(CENT)
+                batch_number = f'B{batch_id:010d}' if expirable else None
+                expiry = when + datetime.timedelta(days=rng.randint(*SHELF_LIFE_DAYS)) if expirable else None
+                batch_table.add((
+                    batch_id, pk, batch_number, when, expiry, quantity,
+                    selling_rate, cost_rate, quantity * selling_rate, quantity * cost_rate,
+                ))
+                items.append((
+                    purchase_item_table.new_id(), purchase_id, batch_id, pk, name, batch_number, cost_rate,
+                    selling_rate, quantity, quantity * selling_rate, quantity * cost_rate, when,
+                ))
+                heapq.heappush(open_batches.setdefault(pk, []), (
+                    (expiry is None, expiry or when, batch_id),
+                    [batch_id, quantity, cost_rate, selling_rate, batch_number, expiry],
+                ))
+                total += quantity * cost_rate
+            purchase_table.add((
+                purchase_id, f"PUR-{next(purchase_numbers):06d}", f'Supplier {rng.randrange(40)}',
+                when, total, '', when, when,
+            ))
+            for item in items:
+                purchase_item_table.add(item)
+
+        for when in _moments(rng, day, _poisson(rng, sales_per_day * trade), 9, 21):
+            sale_id = sale_table.new_id()
+            lines = min(items_per_bill, 1 + int(rng.expovariate(0.6)))
+            items, total, units = [], Decimal(0), 0
+            for pk, name, _, _ in dict.fromkeys(rng.choices(catalog, cum_weights=popularity, k=lines)):
+                batch = _pick_batch(open_batches.get(pk, []), when)
+                if batch is None:
+                    continue
+                batch_id, remaining, cost_rate, selling_rate, batch_number, _ = batch
+                quantity = min(remaining, 1 + int(rng.expovariate(0.8)))
+                batch[1] -= quantity
+                items.append((
+                    sales_item_table.new_id(), sale_id, batch_id, pk, name, batch_number, cost_rate,
+                    selling_rate, quantity, quantity * selling_rate, quantity * cost_rate, when,
+                ))
+                total += quantity * selling_rate
+                units += quantity
+            if not items:
+                continue
+            sale_table.add((
+                sale_id, f"SAL-{next(sale_numbers):06d}", f'Customer {rng.randrange(5000)}',
+                units, total, '', when, when,
+            ))
+            for item in items:
+                sales_item_table.add(item)
+
+    tables = {
+        'products': product_table,
+        'batches': batch_table,
+        'purchases': purchase_table,
+        'purchase_items': purchase_item_table,
+        'sales': sale_table,
+        'sales_items': sales_item_table,
+    }
+    for table in tables.values():
+        table.finish()
+    _settle_batches(first_batch_id)
+
+    # COPY bypasses the snapshot refreshes, so build them over the generated
+    # period, a month apart and on its last day, for the ledger to start from.
+    first_day = timezone.localdate(start)
+    snapshot_days = [first_day + datetime.timedelta(days=offset)
+                     for offset in range(SNAPSHOT_INTERVAL_DAYS - 1, days - 1, SNAPSHOT_INTERVAL_DAYS)]
+    if days:
+        snapshot_days.append(first_day + datetime.timedelta(days=days - 1))
+    snapshots = sum(build_snapshot(day) for day in snapshot_days)
+    invalidate_ledger_cache(history=True)
+    return {**{name: table.written for name, table in tables.items()}, 'stock_snapshots': snapshots}
@@ -1,3 +1,1065 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, connections, transaction
+from django.db.models import Q, Sum
+from django.test import SimpleTestCase, override_settings
+from django.test.client import MULTIPART_CONTENT
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_tenants.test.cases import TenantTestCase
+from django_tenants.test.client import TenantClient
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.authentication import issue_tokens
+from api.models import User
+
+from .cache import cached_ledger, invalidate_ledger_cache
+from .exports import LEDGER_SECTIONS
+from .importer import import_batches, import_products, iter_rows
+from .ledger import SEPARATED_BUCKETS, day_start, stock_at
+from .models import BillSequence, Product, Product_Batch, Purchase, PurchaseItem, Sale, SalesItem, StockSnapshot, TenantData
+from .serializers import (BATCH_NUMBER_TAKEN, BULK_BATCH_SIZE, PRODUCT_NAME_TAKEN, ProductBatchSerializer,
+                          ProductSerializer, PurchaseSerializer, SaleSerializer, SalesItemSerializer)
+from .snapshots import build_snapshot, discard_stock_snapshots
+from .streaming import openpyxl
+from .synthetic import seed_tenant_data
+from .views import PurchaseView, SaleView, StockLedgerSeparatedView, StockLedgerView, items_prefetch
+
+
+class AggregateSQLTests(SimpleTestCase):
+    # Default Meta.ordering used to add an ORDER BY, and for SalesItem a JOIN
+    # to Sale, to every query on these models, aggregates included.
+    since = timezone.make_aware(datetime.datetime(2025, 1, 1))
+
+    def assertPlainSQL(self, queryset):
+        sql = str(queryset.query).upper()
+        self.assertNotIn('JOIN', sql)
+        self.assertNotIn('ORDER BY', sql)
+
+    def test_sales_item_queries(self):
+        self.assertPlainSQL(SalesItem.objects.filter(product_batch=1))
+        self.assertPlainSQL(
+            SalesItem.objects.filter(sold_at__gte=self.since).values('product').annotate(total=Sum('quantity'))
+        )
+
+    def test_purchase_item_queries(self):
+        self.assertPlainSQL(
+            PurchaseItem.objects.filter(purchased_at__gte=self.since).values('product').annotate(total=Sum('quantity'))
+        )
+
+    def test_batch_queries(self):
+        self.assertPlainSQL(Product(pk=1).product_batch_set.all())
+        self.assertPlainSQL(
+            Product_Batch.objects.filter(added_date__gte=self.since).values('product').annotate(total=Sum('quantity'))
+        )
+
+
+def _normalized(stock):
+    return {
+        product_id: (row['qty'], row['cost'], row['selling'])
+        for product_id, row in stock.items()
+        if row['qty'] or row['cost'] or row['selling']
+    }
+
+
+SUMMARY = ('quantity', 'avg_cost_price', 'avg_selling_price')
+
+
+def _reference_stock(product, point, inclusive):
+    # Stock held at ``point`` as StockLedgerView computed it before the
+    # grouped queries: every batch's quantity plus what was sold after.
+    before, after = ('lte', 'gt') if inclusive else ('lt', 'gte')
+    quantity, cost, selling = Decimal('0'), Decimal('0'), Decimal('0')
+    for batch in product.product_batch_set.filter(**{f'added_date__{before}': point}):
+        sold = batch.sales_items.filter(**{f'sale__created_at__{after}': point}).aggregate(total=Sum('quantity'))['total'] or 0
+        held = batch.quantity + sold
+        quantity += held
+        cost += held * batch.cost_rate
+        selling += held * batch.selling_rate
+    return quantity, cost, selling
+
+
+def _reference_moves(items):
+    totals = items.aggregate(quantity=Sum('quantity'), cost=Sum('total_cost_price'), selling=Sum('total_selling_price'))
+    return totals['quantity'] or Decimal('0'), totals['cost'] or Decimal('0'), totals['selling'] or Decimal('0')
+
+
+def _reference_ledger(start_date, end_date):
+    ledger = []
+    for product in Product.objects.order_by('pk'):
+        sections = {
+            'opening': _reference_stock(product, start_date, inclusive=False),
+            'purchases': _reference_moves(PurchaseItem.objects.filter(
+                purchase__purchase_date__gte=start_date, purchase__purchase_date__lte=end_date,
+                product_batch__product=product,
+            )),
+            'sales': _reference_moves(SalesItem.objects.filter(
+                sale__created_at__gte=start_date, sale__created_at__lte=end_date,
+                product_batch__product=product,
+            )),
+            'closing': _reference_stock(product, end_date, inclusive=True),
+        }
+        ledger.append((product.pk, product.name, {
+            name: (quantity, cost / quantity if quantity > 0 else Decimal('0'),
+                   selling / quantity if quantity > 0 else Decimal('0'))
+            for name, (quantity, cost, selling) in sections.items()
+        }))
+    return ledger
+
+
+def _figures(summary):
+    return tuple(round(float(summary[field]), 4) for field in SUMMARY)
+
+
+class StockLedgerTests(TenantTestCase):
+    """Grouped and streamed ledgers must match the old per-product loop."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Ledger'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        seed_tenant_data(products=12, purchases=15, sales=60, items_per_bill=4, days=30, seed=7)
+        self.user = User.objects.create_user(username='ledger', password='ledger')
+        today = timezone.localdate()
+        self.periods = [
+            (today - datetime.timedelta(days=20), today - datetime.timedelta(days=10)),
+            (today - datetime.timedelta(days=25), today),
+        ]
+
+    def get(self, view, start, end, **params):
+        request = APIRequestFactory().get('/', {
+            'start_date': f'{start.isoformat()}T00:00:00Z', 'end_date': f'{end.isoformat()}T00:00:00Z', **params,
+        })
+        force_authenticate(request, user=self.user)
+        response = view.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        if response.streaming:
+            return json.loads(b''.join(response.streaming_content))['data']
+        return json.loads(response.render().content)['data']
+
+    def assertMatchesReference(self, start, end):
+        start_date = day_start(start)
+        end_date = day_start(end) + datetime.timedelta(days=1) - datetime.timedelta(seconds=1)
+        reference = _reference_ledger(start_date, end_date)
+        for section in LEDGER_SECTIONS:
+            self.assertTrue(any(sections[section][0] for _, _, sections in reference), section)
+        expected = [
+            (name, {section: _figures(dict(zip(SUMMARY, figures))) for section, figures in sections.items()})
+            for _, name, sections in reference
+        ]
+        for params in ({}, {'stream': 'true'}):
+            entries = self.get(StockLedgerView, start, end, **params)
+            self.assertEqual(
+                [(entry['product_name'], {section: _figures(entry[section]) for section in LEDGER_SECTIONS})
+                 for entry in entries],
+                expected, params,
+            )
+            buckets = self.get(StockLedgerSeparatedView, start, end, **params)
+            for bucket, section in SEPARATED_BUCKETS:
+                self.assertEqual(
+                    [(entry['product_id'], _figures(entry)) for entry in buckets[bucket]],
+                    [(pk, _figures(dict(zip(SUMMARY, sections[section]))))
+                     for pk, _, sections in reference if sections[section][0] > 0],
+                    (bucket, params),
+                )
+
+    def test_matches_per_product_computation(self):
+        for start, end in self.periods:
+            invalidate_ledger_cache(history=True)
+            self.assertMatchesReference(start, end)
+
+    def test_matches_per_product_computation_from_snapshots(self):
+        today = timezone.localdate()
+        for days in (25, 15, 12, 1):
+            build_snapshot(today - datetime.timedelta(days=days))
+        for start, end in self.periods:
+            invalidate_ledger_cache(history=True)
+            self.assertMatchesReference(start, end)
+
+
+class StockSnapshotLedgerTests(TenantTestCase):
+    """stock_at() read through snapshots must match a replay of every batch."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Snapshots'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.first = Product.objects.create(name='SNAPFIRST', expirable=False)
+        self.second = Product.objects.create(name='SNAPSECOND', expirable=False)
+        self.add_batch(self.first, days_ago=10, bought=100, sold=[(9, 10), (3, 5)])
+        self.add_batch(self.first, days_ago=5, bought=50, sold=[(2, 20)])
+        self.add_batch(self.second, days_ago=9, bought=40, sold=[(1, 4)])
+
+    def at(self, days_ago, hour=12):
+        return day_start(self.today - datetime.timedelta(days=days_ago)) + datetime.timedelta(hours=hour)
+
+    def add_batch(self, product, days_ago, bought, sold=()):
+        # Written as the bulk paths do: no snapshot refresh runs.
+        batch = Product_Batch.objects.create(
+            product=product,
+            quantity=bought - sum(quantity for _, quantity in sold),
+            cost_rate=Decimal('2.00'),
+            selling_rate=Decimal('3.00'),
+        )
+        Product_Batch.objects.filter(pk=batch.pk).update(added_date=self.at(days_ago, hour=8))
+        batch.refresh_from_db()
+        for sold_days_ago, quantity in sold:
+            sale = Sale.objects.create(customer_name='Snapshot', quantity=quantity)
+            SalesItem.objects.create(
+                sale=sale, product_batch=batch, product_name=product.name, quantity=quantity,
+                cost_rate=batch.cost_rate, selling_rate=batch.selling_rate,
+            )
+            SalesItem.objects.filter(sale=sale).update(sold_at=self.at(sold_days_ago))
+        return batch
+
+    def build_snapshots(self, *days_ago):
+        for days in days_ago:
+            build_snapshot(self.today - datetime.timedelta(days=days))
+
+    def replayed(self, point, inclusive):
+        savepoint = transaction.savepoint()
+        try:
+            StockSnapshot.objects.all().delete()
+            return stock_at(point, inclusive)
+        finally:
+            transaction.savepoint_rollback(savepoint)
+
+    def assertMatchesReplay(self, *days_ago):
+        self.assertTrue(StockSnapshot.objects.exists())
+        for days in days_ago:
+            for inclusive in (False, True):
+                point = self.at(days)
+                self.assertEqual(
+                    _normalized(stock_at(point, inclusive)),
+                    _normalized(self.replayed(point, inclusive)),
+                    f"{days} day(s) ago, inclusive={inclusive}",
+                )
+
+    def test_gap_in_snapshot_coverage(self):
+        # A single day built by hand, e.g. build_stock_snapshots --since X --until X.
+        self.build_snapshots(8)
+        self.assertMatchesReplay(7, 6, 4, 2, 1, 0)
+
+    def test_backdated_bulk_write_discards_later_snapshots(self):
+        # Bulk writers send no signals; those that backdate stock, such as
+        # seed_tenant_data, discard the snapshots from the earliest date written.
+        self.build_snapshots(*range(10, 0, -1))
+        batch = self.add_batch(self.second, days_ago=4, bought=30, sold=[(2, 5)])
+        discard_stock_snapshots([self.second.pk], timezone.localdate(batch.added_date))
+        self.assertFalse(StockSnapshot.objects.filter(
+            product=self.second,
+            date__gte=self.today - datetime.timedelta(days=4),
+            date__lt=self.today,
+        ).exists())
+        self.assertMatchesReplay(3, 2, 1, 0)
+
+    def test_product_without_snapshot(self):
+        self.build_snapshots(8)
+        third = Product.objects.create(name='SNAPTHIRD', expirable=False)
+        self.add_batch(third, days_ago=9, bought=25, sold=[(4, 5)])
+        self.assertFalse(StockSnapshot.objects.filter(product=third).exists())
+        self.assertMatchesReplay(6, 3, 0)
+
+    def test_batch_delete_discards_later_snapshots(self):
+        spare = self.add_batch(self.second, days_ago=6, bought=10)
+        self.build_snapshots(*range(10, 0, -1))
+        with self.captureOnCommitCallbacks(execute=True):
+            spare.delete()
+        self.assertFalse(StockSnapshot.objects.filter(
+            product=self.second,
+            date__gte=self.today - datetime.timedelta(days=6),
+            date__lt=self.today,
+        ).exists())
+        self.assertMatchesReplay(5, 2, 0)
+
+
+class SalePostingTests(TenantTestCase):
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Sales'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        self.product = Product.objects.create(name='SALEPROD', expirable=False)
+        self.batch = Product_Batch.objects.create(
+            product=self.product, quantity=10, cost_rate=Decimal('2.00'), selling_rate=Decimal('3.00'),
+        )
+
+    def post_sale(self, *items):
+        serializer = SaleSerializer(data={'customer_name': 'Test', 'items': list(items)})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_lines_on_one_batch_are_summed(self):
+        sale = self.post_sale({'batch_id': self.batch.pk, 'quantity': 4}, {'batch_id': self.batch.pk, 'quantity': 5})
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.quantity, 1)
+        self.assertEqual(self.batch.total_cost_price, Decimal('2.00'))
+        self.assertEqual(self.batch.total_selling_price, Decimal('3.00'))
+        self.assertEqual(self.product.total_quantity(), 1)
+        self.assertEqual(sale.quantity, 9)
+        self.assertEqual(sale.total_amount, Decimal('27.00'))
+
+    def test_oversell_across_lines_is_rejected(self):
+        # Each line fits on its own; together they exceed the batch.
+        with self.assertRaises(ValidationError):
+            self.post_sale({'batch_id': self.batch.pk, 'quantity': 6}, {'batch_id': self.batch.pk, 'quantity': 5})
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.quantity, 10)
+        self.assertEqual(self.product.total_quantity(), 10)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SalesItem.objects.exists())
+
+    def test_batches_are_locked_in_one_ordered_query(self):
+        other = Product_Batch.objects.create(
+            product=self.product, quantity=3, cost_rate=Decimal('2.00'), selling_rate=Decimal('3.00'),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            self.post_sale({'batch_id': other.pk, 'quantity': 1}, {'batch_id': self.batch.pk, 'quantity': 1})
+        locking = [query['sql'] for query in queries.captured_queries if 'FOR UPDATE' in query['sql']]
+        self.assertEqual(len(locking), 1)
+        self.assertIn('ORDER BY', locking[0])
+        self.assertEqual(self.product.total_quantity(), 11)
+
+    def test_items_render_in_line_order(self):
+        sale = self.post_sale({'batch_id': self.batch.pk, 'quantity': 1}, {'batch_id': self.batch.pk, 'quantity': 2})
+        with CaptureQueriesContext(connection) as queries:
+            items = SaleSerializer(Sale.objects.get(pk=sale.pk)).data['items']
+        self.assertEqual([item['quantity'] for item in items], [1, 2])
+        self.assertIn('ORDER BY', queries.captured_queries[-1]['sql'])
+        listed = Sale.objects.prefetch_related(items_prefetch(SalesItem, SalesItemSerializer, 'sale_id'))
+        with CaptureQueriesContext(connection) as queries:
+            SaleSerializer(listed, many=True).data
+        self.assertEqual(len([query for query in queries.captured_queries if 'salesitem' in query['sql']]), 1)
+
+    def expirable_batch(self, product, number, quantity, expires_in_days):
+        return Product_Batch.objects.create(
+            product=product, batch_number=number, quantity=quantity,
+            expiry_date=timezone.now() + datetime.timedelta(days=expires_in_days),
+            cost_rate=Decimal('2.00'), selling_rate=Decimal('3.00'),
+        )
+
+    def test_product_line_splits_first_expiry_first_out(self):
+        product = Product.objects.create(name='FEFOPROD', expirable=True)
+        later = self.expirable_batch(product, 'FEFO-LATE', 10, expires_in_days=200)
+        sooner = self.expirable_batch(product, 'FEFO-SOON', 3, expires_in_days=20)
+        sale = self.post_sale({'product_id': product.pk, 'quantity': 5})
+        self.assertEqual(
+            list(sale.items.order_by('pk').values_list('product_batch', 'quantity')),
+            [(sooner.pk, 3), (later.pk, 2)],
+        )
+        sooner.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual((sooner.quantity, later.quantity), (0, 8))
+
+    def test_expired_batches_are_skipped(self):
+        product = Product.objects.create(name='FEFOEXP', expirable=True)
+        expired = self.expirable_batch(product, 'FEFO-EXPIRED', 10, expires_in_days=-1)
+        valid = self.expirable_batch(product, 'FEFO-VALID', 10, expires_in_days=100)
+        sale = self.post_sale({'product_id': product.pk, 'quantity': 4})
+        self.assertEqual(list(sale.items.values_list('product_batch', 'quantity')), [(valid.pk, 4)])
+        expired.refresh_from_db()
+        self.assertEqual(expired.quantity, 10)
+
+    def test_insufficient_stock_for_product_is_rejected(self):
+        product = Product.objects.create(name='FEFOSHORT', expirable=True)
+        self.expirable_batch(product, 'FEFO-OLD', 10, expires_in_days=-1)
+        self.expirable_batch(product, 'FEFO-NEW', 3, expires_in_days=100)
+        # The expired batch does not count towards what is available.
+        with self.assertRaises(ValidationError):
+            self.post_sale({'product_id': product.pk, 'quantity': 4})
+        self.assertEqual(product.total_quantity(), 13)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_items_follow_request_order(self):
+        product = Product.objects.create(name='FEFOORDER', expirable=True)
+        later = self.expirable_batch(product, 'ORDER-LATE', 10, expires_in_days=200)
+        sooner = self.expirable_batch(product, 'ORDER-SOON', 1, expires_in_days=20)
+        sale = self.post_sale(
+            {'product_id': product.pk, 'quantity': 2},
+            {'batch_id': self.batch.pk, 'quantity': 1},
+        )
+        self.assertEqual(
+            list(sale.items.order_by('pk').values_list('product_batch', flat=True)),
+            [sooner.pk, later.pk, self.batch.pk],
+        )
+
+
+class BillSequenceTests(TenantTestCase):
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Bill numbers'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        self.counters = list(BillSequence.objects.values_list('name', 'last_value'))
+
+    def tearDown(self):
+        # Block reservations commit on their own connection, outside the test
+        # transaction, so the counters are put back there.
+        side = getattr(BillSequence.objects._local, 'connection', None)
+        if side is not None:
+            with side.cursor() as cursor:
+                cursor.executemany(
+                    'UPDATE tenant_data_billsequence SET last_value = %s WHERE name = %s',
+                    [(value, name) for name, value in self.counters],
+                )
+            side.close()
+            del BillSequence.objects._local.connection
+        BillSequence.objects._blocks.clear()
+        super().tearDown()
+
+    def sale(self):
+        return Sale.objects.create(customer_name='Bill', quantity=1).bill_no
+
+    def counter(self):
+        return BillSequence.objects.filter(name='sale').values_list('last_value', flat=True).first()
+
+    def counter_is_locked(self):
+        # Asked from another connection, as a concurrent bill would.
+        other = connections.create_connection(connection.alias)
+        try:
+            other.set_schema(connection.schema_name)
+            with other.cursor() as cursor:
+                try:
+                    cursor.execute("SELECT 1 FROM tenant_data_billsequence WHERE name = 'sale' FOR UPDATE NOWAIT")
+                except OperationalError:
+                    return True
+            return False
+        finally:
+            other.close()
+
+    def test_numbers_are_gapless_with_single_reservations(self):
+        first = self.sale()
+        savepoint = transaction.savepoint()
+        self.sale()
+        transaction.savepoint_rollback(savepoint)
+        self.assertEqual(self.sale(), f'SAL-{int(first[4:]) + 1:06d}')
+        # The counter row stays locked until the bill's transaction ends.
+        self.assertTrue(self.counter_is_locked())
+
+    @override_settings(BILL_NO_BLOCK_SIZE=5)
+    def test_blocks_are_reserved_on_a_separate_connection(self):
+        numbers = [int(self.sale()[4:]) for _ in range(3)]
+        self.assertEqual(numbers, [numbers[0], numbers[0] + 1, numbers[0] + 2])
+        # Committed at once, so nothing waits on the counter.
+        self.assertEqual(self.counter(), numbers[0] + 4)
+        self.assertFalse(self.counter_is_locked())
+
+        savepoint = transaction.savepoint()
+        self.sale()
+        transaction.savepoint_rollback(savepoint)
+        numbers += [int(self.sale()[4:]) for _ in range(3)]
+        # The rolled back bill's number is a gap; the rest keep increasing.
+        self.assertEqual(numbers[3:], [numbers[0] + 4, numbers[0] + 5, numbers[0] + 6])
+        self.assertEqual(self.counter(), numbers[0] + 9)
+
+    def test_bulk_runs_follow_single_numbers(self):
+        first = int(self.sale()[4:])
+        self.assertEqual(list(BillSequence.objects.next_values('sale', 3)), [first + 1, first + 2, first + 3])
+        self.assertEqual(self.sale(), f'SAL-{first + 4:06d}')
+        self.assertEqual(list(BillSequence.objects.next_values('sale', 0)), [])
+
+    def test_existing_bills_seed_the_counters(self):
+        # Bill numbers used to follow the primary key.
+        for number in range(3):
+            Sale.objects.create(bill_no=f'SAL-OLD-{number}', customer_name='Old', quantity=1)
+        last_sale = Sale.objects.order_by('-pk').values_list('pk', flat=True).first()
+        BillSequence.objects.all().delete()
+        seed = importlib.import_module('tenant_data.migrations.0006_billsequence').seed_bill_sequences
+        seed(django_apps, None)
+        self.assertEqual(
+            dict(BillSequence.objects.values_list('name', 'last_value')),
+            {'purchase': 0, 'sale': last_sale},
+        )
+        self.assertEqual(self.sale(), f'SAL-{last_sale + 1:06d}')
+
+
+class LedgerCacheTests(TenantTestCase):
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Ledger cache'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }))
+        self.end_date = day_start(timezone.localdate() - datetime.timedelta(days=1))
+        self.start_date = self.end_date - datetime.timedelta(days=30)
+        self.computed = 0
+
+    def compute(self):
+        self.computed += 1
+        return self.computed
+
+    def ledger(self):
+        return cached_ledger('combined', self.start_date, self.end_date, self.compute)
+
+    def test_closed_period_is_recomputed_after_a_backdated_edit(self):
+        product = Product.objects.create(name='CACHEPROD', expirable=False)
+        batch = Product_Batch.objects.create(product=product, quantity=5)
+        self.assertEqual((self.ledger(), self.ledger()), (1, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            batch.quantity = 4
+            batch.save()
+        self.assertEqual(self.ledger(), 2)
+
+    def test_new_sale_keeps_closed_periods(self):
+        self.ledger()
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(customer_name='Cache', quantity=1)
+        self.assertEqual(self.ledger(), 1)
+
+    def test_process_local_cache_expires_closed_periods(self):
+        # A token replaced in another worker never reaches this process.
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                               LEDGER_CACHE_TIMEOUT=0):
+            self.assertEqual((self.ledger(), self.ledger()), (1, 2))
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+BENCHMARK_VOLUMES = {
+    'products': _env_int('BENCHMARK_PRODUCTS', 200),
+    'purchases': _env_int('BENCHMARK_PURCHASES', 100),
+    'sales': _env_int('BENCHMARK_SALES', 300),
+    'items_per_bill': _env_int('BENCHMARK_ITEMS_PER_BILL', 5),
+    'days': _env_int('BENCHMARK_DAYS', 90),
+}
+# Path of the JSON report; nothing is written unless it is set.
+BENCHMARK_REPORT = os.environ.get('BENCHMARK_REPORT')
+
+# Most queries each request may run, whatever the seeded volume. Counts
+# include the savepoints the test transaction turns atomic blocks into and
+# the SET search_path django-tenants issues before each statement.
+QUERY_BUDGETS = {
+    'product-list': 2,
+    'product-create': 8,
+    'product-detail': 2,
+    'product-update': 8,
+    'product-delete': 12,
+    'product-import': 8,
+    'batch-list': 2,
+    'batch-create': 8,
+    'batch-detail': 4,
+    'batch-update': 10,
+    'batch-delete': 8,
+    'batch-import': 14,
+    'purchase-list': 4,
+    'purchase-create': 18,
+    'purchase-export': 1,
+    'sale-list': 4,
+    'sale-create': 16,
+    'sale-export': 1,
+    'ledger': 17,
+    'ledger-stream': 17,
+    'ledger-export': 17,
+    'ledger-separated': 17,
+    'ledger-separated-stream': 20,
+    'tenantdata-list': 2,
+    'tenantdata-create': 2,
+    'tenantdata-detail': 2,
+    'tenantdata-update': 4,
+    'tenantdata-delete': 4,
+}
+
+
+class CatalogImportTests(TenantTestCase):
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Imports'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def rows(self, text, fmt='csv'):
+        return iter_rows(io.BytesIO(text.encode('utf-8')), fmt)
+
+    def test_product_rows_that_fail_are_reported_by_line(self):
+        Product.objects.create(name='Aspirin')
+        result = import_products(self.rows(
+            'name,product_type,expirable\n'
+            'Ibuprofen,tablet,false\n'
+            'ASPIRIN,tablet,false\n'
+            'ibuprofen,tablet,false\n'
+            ',tablet,true\n'
+            'Paracetamol,,\n'
+        ))
+
+        self.assertEqual((result['created'], result['failed']), (2, 3))
+        self.assertEqual([error['row'] for error in result['errors']], [3, 4, 5])
+        self.assertEqual(result['errors'][0]['errors'], {'name': [PRODUCT_NAME_TAKEN]})
+        self.assertEqual(result['errors'][1]['errors'], {'name': [PRODUCT_NAME_TAKEN]})
+        self.assertIn('name', result['errors'][2]['errors'])
+        # Blank cells fall back to the model defaults.
+        self.assertTrue(Product.objects.get(name='Paracetamol').expirable)
+        self.assertFalse(Product.objects.get(name='Ibuprofen').expirable)
+
+    def test_malformed_jsonl_lines_are_reported(self):
+        result = import_products(self.rows(
+            '{"name": "Cetirizine", "expirable": false}\n'
+            '\n'
+            '{"name": \n'
+            '["Loratadine"]\n'
+            '{"name": "Loratadine"}\n',
+            fmt='jsonl',
+        ))
+
+        self.assertEqual((result['created'], result['failed']), (2, 2))
+        self.assertEqual([error['row'] for error in result['errors']], [3, 4])
+        self.assertTrue(result['errors'][0]['errors'].startswith('Invalid JSON'))
+        self.assertEqual(result['errors'][1]['errors'], 'Expected a JSON object.')
+
+    def test_batch_rows_that_fail_are_reported_by_line(self):
+        plain = Product.objects.create(name='Gauze', expirable=False)
+        Product.objects.create(name='Insulin', expirable=True)
+        Product_Batch.objects.create(product=plain, batch_number='G-1', quantity=1)
+        expiry = (timezone.now() + datetime.timedelta(days=90)).isoformat()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_batches(self.rows(
+                'product_id,product_name,batch_number,expiry_date,quantity,cost_rate,selling_rate\n'
+                f'{plain.pk},,,,4,1.00,1.50\n'
+                f',insulin,I-1,{expiry},2,9.00,12.00\n'
+                ',Unknown,,,1,1.00,1.00\n'
+                ',Insulin,I-2,,1,9.00,12.00\n'
+                ',Gauze,g-1,,1,1.00,1.50\n'
+                f',Insulin,i-1,{expiry},1,9.00,12.00\n'
+            ))
+
+        self.assertEqual((result['created'], result['failed']), (2, 4))
+        self.assertEqual([error['row'] for error in result['errors']], [4, 5, 6, 7])
+        self.assertIn('Unknown product', str(result['errors'][0]['errors']))
+        self.assertEqual(result['errors'][1]['errors'], {'expiry_date': ['This field is required for expirable products.']})
+        self.assertEqual(result['errors'][2]['errors'], {'batch_number': [BATCH_NUMBER_TAKEN]})
+        self.assertEqual(result['errors'][3]['errors'], {'batch_number': [BATCH_NUMBER_TAKEN]})
+        imported = Product_Batch.objects.get(batch_number='I-1')
+        self.assertEqual((imported.quantity, imported.total_cost_price), (2, Decimal('18.00')))
+        self.assertEqual(plain.product_batch_set.aggregate(total=Sum('quantity'))['total'], 5)
+
+
+class RegisterExportTests(TenantTestCase):
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Exports'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exports', password='exports')
+        product = Product.objects.create(name='EXPORTED', expirable=True)
+        expiry = (timezone.now() + datetime.timedelta(days=365)).isoformat()
+        purchase = PurchaseSerializer(data={'supplier_name': 'Acme', 'items': [
+            {'product_id': product.pk, 'batch_number': 'EX-1', 'expiry_date': expiry,
+             'quantity': 10, 'cost_rate': '2.00', 'selling_rate': '3.00'},
+        ]})
+        purchase.is_valid(raise_exception=True)
+        self.purchase = purchase.save()
+        batch = Product_Batch.objects.get(batch_number='EX-1')
+        self.sales = []
+        for quantities in ((1,), (2, 3)):
+            sale = SaleSerializer(data={'customer_name': 'Walk-in', 'items': [
+                {'batch_id': batch.pk, 'quantity': quantity} for quantity in quantities
+            ]})
+            sale.is_valid(raise_exception=True)
+            self.sales.append(sale.save())
+
+    def export(self, view, fmt='csv', **params):
+        request = APIRequestFactory().get('/', {'format': fmt, **params})
+        request.tenant = self.tenant
+        force_authenticate(request, user=self.user)
+        return view.as_view()(request)
+
+    def csv_rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+
+    def test_sales_register_has_one_row_per_line_item(self):
+        response = self.export(SaleView)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales.csv"')
+        rows = self.csv_rows(response)
+        self.assertEqual(rows[0], [
+            'bill_no', 'created_at', 'customer_name', 'product_name', 'batch_number', 'quantity',
+            'selling_rate', 'total_selling_price', 'cost_rate', 'total_cost_price',
+        ])
+        self.assertEqual(rows[1:], [
+            [sale.bill_no, str(sale.created_at), 'Walk-in', 'EXPORTED', 'EX-1', str(quantity),
+             '3.00', f'{3 * quantity}.00', '2.00', f'{2 * quantity}.00']
+            for sale, quantity in ((self.sales[0], 1), (self.sales[1], 2), (self.sales[1], 3))
+        ])
+
+    def test_bill_register_has_one_row_per_bill(self):
+        rows = self.csv_rows(self.export(SaleView, include='bills'))
+        self.assertEqual(rows[0], ['bill_no', 'created_at', 'customer_name', 'quantity', 'total_amount', 'notes'])
+        self.assertEqual(rows[1:], [
+            [self.sales[0].bill_no, str(self.sales[0].created_at), 'Walk-in', '1', '3.00', ''],
+            [self.sales[1].bill_no, str(self.sales[1].created_at), 'Walk-in', '5', '15.00', ''],
+        ])
+
+        rows = self.csv_rows(self.export(PurchaseView, include='bills'))
+        self.assertEqual(rows[1:], [[
+            self.purchase.bill_no, '', str(self.purchase.created_at), 'Acme', '20.00', '',
+        ]])
+
+    def test_accept_header_selects_the_export(self):
+        request = APIRequestFactory().get('/', HTTP_ACCEPT='text/csv')
+        request.tenant = self.tenant
+        force_authenticate(request, user=self.user)
+        rows = self.csv_rows(PurchaseView.as_view()(request))
+        self.assertEqual([row[4:7] for row in rows[1:]], [['EXPORTED', 'EX-1', '10']])
+
+    @unittest.skipIf(openpyxl, "openpyxl is installed")
+    def test_xlsx_needs_openpyxl(self):
+        response = self.export(SaleView, fmt='xlsx')
+        self.assertEqual(response.status_code, 406)
+        self.assertIn('openpyxl', json.loads(response.render().content)['message'])
+
+    @unittest.skipUnless(openpyxl, "openpyxl is not installed")
+    def test_xlsx_register(self):
+        response = self.export(SaleView, fmt='xlsx')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="sales.xlsx"')
+        workbook = openpyxl.load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        rows = list(workbook.active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row[5] for row in rows[1:]], [1, 2, 3])
+        # Excel has no time zones, so dates are written in local time, and it
+        # keeps them to the millisecond.
+        self.assertAlmostEqual(
+            rows[1][1], timezone.localtime(self.sales[0].created_at).replace(tzinfo=None),
+            delta=datetime.timedelta(milliseconds=1),
+        )
+
+
+class UniqueNameRaceTests(TenantTestCase):
+    """A name taken between validation and save is still a 400, not a 500."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Races'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Syringe', expirable=True)
+        self.expiry = (timezone.now() + datetime.timedelta(days=30)).isoformat()
+
+    def test_product_name_taken_after_validation(self):
+        serializer = ProductSerializer(data={'name': 'Bandage', 'expirable': False})
+        self.assertTrue(serializer.is_valid())
+        Product.objects.create(name='BANDAGE')
+        with self.assertRaises(ValidationError) as raised:
+            serializer.save()
+        self.assertEqual(raised.exception.detail, {'name': [PRODUCT_NAME_TAKEN]})
+        self.assertEqual(Product.objects.filter(name__iexact='bandage').count(), 1)
+
+    def test_batch_number_taken_after_validation(self):
+        serializer = ProductBatchSerializer(data={
+            'product': self.product.pk, 'batch_number': 'lot-7', 'expiry_date': self.expiry,
+            'quantity': 1, 'cost_rate': '1.00', 'selling_rate': '2.00',
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        Product_Batch.objects.create(product=self.product, batch_number='LOT-7', quantity=1)
+        with self.assertRaises(ValidationError) as raised:
+            serializer.save()
+        self.assertEqual(raised.exception.detail, {'batch_number': [BATCH_NUMBER_TAKEN]})
+
+    def test_purchase_batch_number_taken_after_validation(self):
+        serializer = PurchaseSerializer(data={'supplier_name': 'Acme', 'items': [
+            {'product_id': self.product.pk, 'batch_number': 'lot-8', 'expiry_date': self.expiry,
+             'quantity': 1, 'cost_rate': '1.00', 'selling_rate': '2.00'},
+        ]})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        Product_Batch.objects.create(product=self.product, batch_number='LOT-8', quantity=1)
+        with self.assertRaises(ValidationError) as raised:
+            serializer.save()
+        self.assertEqual(raised.exception.detail, {'items': [BATCH_NUMBER_TAKEN]})
+        # The whole bill was rolled back.
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(Product_Batch.objects.filter(batch_number__iexact='lot-8').count(), 1)
+
+
+class LedgerBackfillMigrationTests(TenantTestCase):
+    """0010 fills in the ledger columns 0009 added, one key range at a time."""
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Backfill'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    def setUp(self):
+        seed_tenant_data(products=5, purchases=4, sales=8, items_per_bill=3, days=10, seed=11)
+        self.migration = importlib.import_module('tenant_data.migrations.0010_backfill_ledger_fields')
+
+    def ledger_fields(self):
+        return (
+            list(SalesItem.objects.order_by('pk').values_list('pk', 'product_id', 'sold_at')),
+            list(PurchaseItem.objects.order_by('pk').values_list('pk', 'product_id', 'purchased_at')),
+        )
+
+    def test_backfill_restores_product_and_dates(self):
+        expected = self.ledger_fields()
+        self.assertTrue(all(row[1] and row[2] for rows in expected for row in rows))
+        SalesItem.objects.update(product=None, sold_at=None)
+        PurchaseItem.objects.update(product=None, purchased_at=None)
+
+        # Small chunks, so several key ranges and a partial last one are run.
+        with mock.patch.object(self.migration, 'BACKFILL_CHUNK', 4):
+            self.migration.backfill_ledger_fields(django_apps, SimpleNamespace(connection=connection))
+
+        self.assertEqual(self.ledger_fields(), expected)
+
+    def test_rows_already_filled_are_left_alone(self):
+        item = SalesItem.objects.order_by('pk').first()
+        other = Product.objects.exclude(pk=item.product_id).order_by('pk').first()
+        SalesItem.objects.filter(pk=item.pk).update(product=other)
+        SalesItem.objects.exclude(pk=item.pk).update(product=None, sold_at=None)
+
+        self.migration.backfill_ledger_fields(django_apps, SimpleNamespace(connection=connection))
+
+        self.assertEqual(SalesItem.objects.get(pk=item.pk).product_id, other.pk)
+        self.assertFalse(SalesItem.objects.filter(Q(product__isnull=True) | Q(sold_at__isnull=True)).exists())
+
+
+class EndpointBenchmarkTests(TenantTestCase):
+    """Query counts and wall time for every tenant_data endpoint.
+
+    Volumes come from the BENCHMARK_* environment variables; the results are
+    written as JSON to BENCHMARK_REPORT, when set, once the class finishes.
+    Requests run against a file-based cache, shared the way production's is.
+    """
+    results = []
+
+    @classmethod
+    def setup_tenant(cls, tenant):
+        tenant.name = 'Benchmark'
+        tenant.paid_until = datetime.date(2099, 12, 31)
+
+    @classmethod
+    def setUpClass(cls):
+        # Measured as deployed: JWT claims are only trusted with a shared cache.
+        directory = cls.enterClassContext(tempfile.TemporaryDirectory())
+        cls.enterClassContext(override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }))
+        super().setUpClass()
+        cls.results = []
+        cls.seeded = seed_tenant_data(**BENCHMARK_VOLUMES)
+        user = User.objects.create_user(username='benchmark', password='benchmark', tenant=cls.tenant)
+        cls.auth = {
+            'HTTP_AUTHORIZATION': f'Bearer {issue_tokens(user).access_token}',
+            'HTTP_HOST': cls.domain.domain,
+        }
+        cls.tenant_client = TenantClient(cls.tenant)
+        # Fill the tenant and permission caches so no measurement pays for them.
+        cls.tenant_client.get(reverse('product-list'), **cls.auth)
+
+        now = timezone.now()
+        cls.ledger_params = {
+            'start_date': (now - datetime.timedelta(days=BENCHMARK_VOLUMES['days'])).strftime('%Y-%m-%dT00:00:00Z'),
+            'end_date': now.strftime('%Y-%m-%dT00:00:00Z'),
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        if BENCHMARK_REPORT:
+            report = {
+                'generated_at': timezone.now().isoformat(),
+                'volumes': BENCHMARK_VOLUMES,
+                'seeded': cls.seeded,
+                'endpoints': sorted(cls.results, key=lambda result: result['name']),
+            }
+            with open(BENCHMARK_REPORT, 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+        super().tearDownClass()
+
+    def measure(self, name, method, path, data=None, **extra):
+        invalidate_ledger_cache(history=True)
+        request = getattr(self.tenant_client, method)
+        if data is not None and 'content_type' not in extra and method != 'get':
+            extra['content_type'] = 'application/json'
+            data = json.dumps(data)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = request(path, data, **self.auth, **extra)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = time.perf_counter() - started
+        self.results.append({
+            'name': name,
+            'method': method.upper(),
+            'path': path,
+            'status': response.status_code,
+            'queries': len(queries),
+            'budget': QUERY_BUDGETS[name],
+            'seconds': round(elapsed, 4),
+        })
+        self.assertLess(response.status_code, 400, body[:500])
+        self.assertLessEqual(
+            len(queries), QUERY_BUDGETS[name],
+            f"{name} ran {len(queries)} queries:\n" + '\n'.join(query['sql'] for query in queries.captured_queries),
+        )
+        return body
+
+    def assertPage(self, body, total):
+        # A first page of a keyset-paginated listing holding ``total`` rows.
+        payload = json.loads(body)
+        page_size = settings.TENANT_LIST_PAGE_SIZE
+        self.assertTrue(payload['success'])
+        self.assertEqual(len(payload['data']), min(total, page_size))
+        self.assertEqual(payload['next'] is not None, total > page_size)
+        return payload['data']
+
+    def assertCSVRows(self, body, total):
+        rows = list(csv.reader(io.StringIO(body.decode('utf-8'))))
+        self.assertEqual(len(rows), total + 1)
+
+    def assertBillTotals(self, bill, total_field):
+        self.assertTrue(bill['items'])
+        self.assertEqual(
+            sum(Decimal(item[total_field]) for item in bill['items']),
+            Decimal(bill['total_amount']),
+        )
+
+    def assertLedger(self, entries, closing):
+        self.assertEqual(len(entries), Product.objects.count())
+        self.assertEqual(sum(Decimal(str(entry['closing']['quantity'])) for entry in entries), closing)
+
+    def stock_held(self):
+        return Product_Batch.objects.aggregate(total=Sum('quantity'))['total'] or 0
+
+    def in_stock_batch(self):
+        return Product_Batch.objects.filter(quantity__gte=2).filter(
+            Q(expiry_date__isnull=True) | Q(expiry_date__gt=timezone.now())
+        ).select_related('product').order_by('pk').first()
+
+    def test_products(self):
+        self.assertPage(self.measure('product-list', 'get', reverse('product-list')), Product.objects.count())
+        product = Product.objects.order_by('pk').first()
+        data = json.loads(self.measure('product-detail', 'get', reverse('product-detail', args=[product.pk])))['data']
+        self.assertEqual(data['id'], product.pk)
+        self.assertEqual(data['total_quantity'], product.total_quantity())
+        body = self.measure('product-update', 'put', reverse('product-detail', args=[product.pk]), {'product_type': 'updated'})
+        self.assertEqual(json.loads(body)['data']['product_type'], 'updated')
+        self.measure('product-create', 'post', reverse('product-list'), {'name': 'BENCHNEW', 'expirable': False})
+        self.assertTrue(Product.objects.filter(name='BENCHNEW').exists())
+        spare = Product.objects.create(name='BENCHSPARE')
+        self.measure('product-delete', 'delete', reverse('product-detail', args=[spare.pk]))
+        self.assertFalse(Product.objects.filter(pk=spare.pk).exists())
+
+    def test_product_import(self):
+        rows = ''.join(f'BENCHIMP{i:04d},imported,false\n' for i in range(BULK_BATCH_SIZE))
+        upload = SimpleUploadedFile('products.csv', f'name,product_type,expirable\n{rows}'.encode(), content_type='text/csv')
+        body = self.measure('product-import', 'post', reverse('product-import'), {'file': upload}, content_type=MULTIPART_CONTENT)
+        self.assertEqual((json.loads(body)['created'], json.loads(body)['failed']), (BULK_BATCH_SIZE, 0))
+        self.assertEqual(Product.objects.filter(name__startswith='BENCHIMP').count(), BULK_BATCH_SIZE)
+
+    def test_batches(self):
+        self.assertPage(self.measure('batch-list', 'get', reverse('batch-list')), Product_Batch.objects.count())
+        batch = Product_Batch.objects.order_by('pk').first()
+        data = json.loads(self.measure('batch-detail', 'get', reverse('batch-detail', args=[batch.pk])))['data']
+        self.assertEqual((data['id'], data['quantity']), (batch.pk, batch.quantity))
+        body = self.measure('batch-update', 'put', reverse('batch-detail', args=[batch.pk]), {'quantity': batch.quantity})
+        self.assertEqual(json.loads(body)['data']['quantity'], batch.quantity)
+        product = Product.objects.filter(expirable=False).order_by('pk').first()
+        before = product.product_batch_set.count()
+        self.measure('batch-create', 'post', reverse('batch-list'), {
+            'product': product.pk, 'quantity': 5, 'cost_rate': '1.00', 'selling_rate': '1.50',
+        })
+        self.assertEqual(product.product_batch_set.count(), before + 1)
+        spare = Product_Batch.objects.create(product=product, quantity=1)
+        self.measure('batch-delete', 'delete', reverse('batch-detail', args=[spare.pk]))
+        self.assertFalse(Product_Batch.objects.filter(pk=spare.pk).exists())
+
+    def test_batch_import(self):
+        product = Product.objects.filter(expirable=False).order_by('pk').first()
+        before = product.product_batch_set.count()
+        rows = ''.join(f'{product.pk},3,1.00,1.20\n' for _ in range(BULK_BATCH_SIZE))
+        upload = SimpleUploadedFile('batches.csv', f'product_id,quantity,cost_rate,selling_rate\n{rows}'.encode(), content_type='text/csv')
+        body = self.measure('batch-import', 'post', reverse('batch-import'), {'file': upload}, content_type=MULTIPART_CONTENT)
+        self.assertEqual((json.loads(body)['created'], json.loads(body)['failed']), (BULK_BATCH_SIZE, 0))
+        self.assertEqual(product.product_batch_set.count(), before + BULK_BATCH_SIZE)
+
+    def test_purchases(self):
+        bills = self.assertPage(self.measure('purchase-list', 'get', reverse('create_purchase')), Purchase.objects.count())
+        self.assertBillTotals(bills[0], 'total_cost_price')
+        body = self.measure('purchase-export', 'get', reverse('create_purchase'), {'format': 'csv'})
+        self.assertCSVRows(body, PurchaseItem.objects.count())
+        products = list(Product.objects.order_by('pk')[:BENCHMARK_VOLUMES['items_per_bill']])
+        expiry = (timezone.now() + datetime.timedelta(days=365)).isoformat()
+        body = self.measure('purchase-create', 'post', reverse('create_purchase'), {
+            'supplier_name': 'Benchmark',
+            'purchase_date': timezone.now().isoformat(),
+            'items': [
+                {'product_id': product.pk, 'batch_number': f'BENCH-PUR-{product.pk}', 'expiry_date': expiry,
+                 'quantity': 10, 'cost_rate': '2.00', 'selling_rate': '2.50'}
+                for product in products
+            ],
+        })
+        bill = json.loads(body)['data']
+        self.assertEqual(len(bill['items']), len(products))
+        self.assertEqual(Decimal(bill['total_amount']), Decimal('20.00') * len(products))
+
+    def test_sales(self):
+        bills = self.assertPage(self.measure('sale-list', 'get', reverse('create_sale')), Sale.objects.count())
+        self.assertBillTotals(bills[0], 'total_selling_price')
+        body = self.measure('sale-export', 'get', reverse('create_sale'), {'format': 'csv'})
+        self.assertCSVRows(body, SalesItem.objects.count())
+        batch = self.in_stock_batch()
+        held = self.stock_held()
+        body = self.measure('sale-create', 'post', reverse('create_sale'), {
+            'customer_name': 'Benchmark',
+            'items': [{'batch_id': batch.pk, 'quantity': 1}, {'product_id': batch.product_id, 'quantity': 1}],
+        })
+        bill = json.loads(body)['data']
+        self.assertEqual(bill['quantity'], 2)
+        self.assertBillTotals(bill, 'total_selling_price')
+        self.assertEqual(self.stock_held(), held - 2)
+
+    def test_ledger(self):
+        # Both ledger routes share a URL name, so they are addressed by path.
+        combined, separated = '/tenant/reports/stocksLedger', '/tenant/reports/stocksLedgerSeperate'
+        held = self.stock_held()
+        self.assertLedger(json.loads(self.measure('ledger', 'get', combined, self.ledger_params))['data'], held)
+        body = self.measure('ledger-stream', 'get', combined, {**self.ledger_params, 'stream': 'true'})
+        self.assertLedger(json.loads(body)['data'], held)
+        body = self.measure('ledger-export', 'get', combined, {**self.ledger_params, 'format': 'csv'})
+        self.assertCSVRows(body, Product.objects.count())
+        for name, params in (('ledger-separated', self.ledger_params),
+                             ('ledger-separated-stream', {**self.ledger_params, 'stream': 'true'})):
+            buckets = json.loads(self.measure(name, 'get', separated, params))['data']
+            self.assertEqual(set(buckets), {'openings', 'purchases', 'sales', 'closings'})
+            self.assertEqual(sum(Decimal(str(entry['quantity'])) for entry in buckets['closings']), held)
+
+    def test_tenant_data(self):
+        body = self.measure('tenantdata-create', 'post', reverse('tenantdata-list'), {'name': 'Benchmark'})
+        self.assertEqual(json.loads(body)['name'], 'Benchmark')
+        self.assertEqual(len(json.loads(self.measure('tenantdata-list', 'get', reverse('tenantdata-list')))), 1)
+        entry = TenantData.objects.order_by('pk').first()
+        body = self.measure('tenantdata-detail', 'get', reverse('tenantdata-detail', args=[entry.pk]))
+        self.assertEqual(json.loads(body)['id'], entry.pk)
+        body = self.measure('tenantdata-update', 'put', reverse('tenantdata-detail', args=[entry.pk]), {'name': 'Renamed'})
+        self.assertEqual(json.loads(body)['name'], 'Renamed')
+        self.measure('tenantdata-delete', 'delete', reverse('tenantdata-detail', args=[entry.pk]))
+        self.assertFalse(TenantData.objects.filter(pk=entry.pk).exists())
@@ -26,9 +26,11 @@ urlpatterns = [
     
     path('products/', views.ProductListCreateView.as_view(), name='product-list'),
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product-detail'),
+    path('products/import/', views.CatalogImportView.as_view(kind='products'), name='product-import'),
     
     path('batches/', views.BatchListCreateView.as_view(), name='batch-list'),
     path('batches/<int:pk>/', views.BatchDetailView.as_view(), name='batch-detail'),
+    path('batches/import/', views.CatalogImportView.as_view(kind='batches'), name='batch-import'),
     
     path('tenantdata/', views.TenantDataListCreateView.as_view(), name='tenantdata-list'),
     path('tenantdata/<int:pk>/', views.TenantDataDetailView.as_view(), name='tenantdata-detail'),
@@ -1,28 +1,55 @@
 import datetime
-from decimal import Decimal
 
-from django.db.models import Sum
+from django.db.models import Prefetch
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 from rest_framework import status
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 
+from .cache import cached_ledger, get_cached_ledger
+from .exports import (LEDGER_HEADER, SEPARATED_HEADER, ledger_rows, purchases_register,
+                      sales_register, separated_rows)
+from .importer import IMPORTERS, IMPORT_FORMATS, import_format, iter_rows
+from .ledger import (SEPARATED_BUCKETS, bucket_entries, iter_stock_ledger,
+                     ledger_entries, separated_ledger)
 from .models import *
+from .pagination import KeysetPagination
 from .serializers import *
+from .streaming import (EXPORT_RENDERERS, export_format, export_response, json_stream_response,
+                        wants_stream)
 
 
 # Create your views here.
 def get_tenant(request):
     return getattr(request, 'tenant', None)
 
+
+def wants_items(request):
+    # Line items are included unless ?include= is given without "items".
+    include = request.query_params.get('include')
+    return include is None or 'items' in include.split(',')
+
+
+# For views that also answer ?format=csv / ?format=xlsx.
+EXPORT_RENDERER_CLASSES = [*api_settings.DEFAULT_RENDERER_CLASSES, *EXPORT_RENDERERS]
+
+
+def items_prefetch(model, serializer_class, parent_field):
+    # Load only the columns the item serializer renders.
+    fields = [parent_field, *serializer_class.Meta.fields]
+    return Prefetch('items', queryset=model.objects.only(*fields).order_by('pk'))
+
 class ProductListCreateView(APIView):
     def get(self, request):
         tenant = get_tenant(request)
         if not tenant:
             return Response({"error": "Tenant not resolved"}, status=400)
-        qs = Product.objects.all()
+        paginator = KeysetPagination(ordering=('id',))
+        qs = paginator.paginate_queryset(Product.objects.with_stock_totals(), request, view=self)
         ser = ProductSerializer(qs, many=True)
-        return Response({"success":True, "data": ser.data}, status=status.HTTP_200_OK)
+        return Response({"success":True, "data": ser.data, "next": paginator.get_next_link()}, status=status.HTTP_200_OK)
 
     def post(self, request):
         tenant = get_tenant(request)
@@ -42,7 +69,7 @@ class ProductDetailView(APIView):
         if not tenant:
             return Response({"error": "Tenant not found"}, status=400)
         try:
-            obj = Product.objects.get(pk=pk)
+            obj = Product.objects.with_stock_totals().get(pk=pk)
         except Product.DoesNotExist:
             return Response({"success":False, "message":"Product not found"},status=status.HTTP_404_NOT_FOUND)
         serializer = ProductSerializer(obj)
@@ -53,7 +80,7 @@ class ProductDetailView(APIView):
         if not tenant:
             return Response({"error": "Tenant not found"}, status=400)
         try:
-            obj = Product.objects.get(pk=pk)
+            obj = Product.objects.with_stock_totals().get(pk=pk)
         except Product.DoesNotExist:
             return Response({"success":False, "message":"Product not found"},status=status.HTTP_404_NOT_FOUND)
         serializer = ProductSerializer(obj, data=request.data, partial=True)
@@ -80,9 +107,10 @@ class BatchListCreateView(APIView):
         tenant = get_tenant(request)
         if not tenant:
             return Response({"error": "Tenant not found"}, status=400)
-        items = Product_Batch.objects.all()
+        paginator = KeysetPagination(ordering=('-added_date', '-id'))
+        items = paginator.paginate_queryset(Product_Batch.objects.select_related('product'), request, view=self)
         serializer = ProductBatchSerializer(items, many=True)
-        return Response({"success":True, "data": serializer.data}, status=status.HTTP_200_OK)
+        return Response({"success":True, "data": serializer.data, "next": paginator.get_next_link()}, status=status.HTTP_200_OK)
 
     def post(self, request):
         tenant = get_tenant(request)
@@ -132,14 +160,50 @@ class BatchDetailView(APIView):
         return Response({"success":True, "message":"Product Batch Deleted Successfully"},status=status.HTTP_204_NO_CONTENT)
 
 
+class CatalogImportView(APIView):
+    # Upload a CSV or JSONL file in the "file" field; the format comes from
+    # the file extension unless ?file_format= is given.
+    kind = None
+
+    def post(self, request):
+        tenant = get_tenant(request)
+        if not tenant:
+            return Response({"error": "Tenant not found"}, status=400)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"success": False, "message": "Upload the file in the 'file' field."}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.query_params.get('file_format') or import_format(upload.name)
+        if fmt not in IMPORT_FORMATS:
+            return Response({"success": False, "message": f"file_format must be one of {', '.join(IMPORT_FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+        result = IMPORTERS[self.kind](iter_rows(upload, fmt))
+        if result['created'] or not result['failed']:
+            response_status = status.HTTP_201_CREATED
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({"success": not result['failed'], **result}, status=response_status)
+
+
 class SaleView(APIView):
+    renderer_classes = EXPORT_RENDERER_CLASSES
+
     def get(self, request):
         tenant = get_tenant(request)
         if not tenant:
             return Response({"error": "Tenant not resolved"}, status=400)
+        include_items = wants_items(request)
+        fmt = export_format(request)
+        if fmt:
+            header, rows = sales_register(include_items)
+            return export_response(fmt, 'sales', header, rows)
+
+        paginator = KeysetPagination(ordering=('-created_at', '-id'))
         qs = Sale.objects.all()
-        ser = SaleSerializer(qs, many=True)
-        return Response({"success":True, "data": ser.data}, status=status.HTTP_200_OK)
+        if include_items:
+            qs = qs.prefetch_related(items_prefetch(SalesItem, SalesItemSerializer, 'sale_id'))
+        qs = paginator.paginate_queryset(qs, request, view=self)
+        ser = SaleSerializer(qs, many=True, context={'include_items': include_items})
+        return Response({"success":True, "data": ser.data, "next": paginator.get_next_link()}, status=status.HTTP_200_OK)
     
     def post(self, request):
         serializer = SaleSerializer(data=request.data)
@@ -151,13 +215,25 @@ class SaleView(APIView):
 
 
 class PurchaseView(APIView):
+    renderer_classes = EXPORT_RENDERER_CLASSES
+
     def get(self, request):
         tenant = get_tenant(request)
         if not tenant:
             return Response({"error": "Tenant not resolved"}, status=400)
+        include_items = wants_items(request)
+        fmt = export_format(request)
+        if fmt:
+            header, rows = purchases_register(include_items)
+            return export_response(fmt, 'purchases', header, rows)
+
+        paginator = KeysetPagination(ordering=('-created_at', '-id'))
         qs = Purchase.objects.all()
-        ser = PurchaseSerializer(qs, many=True)
-        return Response({"success":True, "data": ser.data}, status=status.HTTP_200_OK)
+        if include_items:
+            qs = qs.prefetch_related(items_prefetch(PurchaseItem, PurchaseItemSerializer, 'purchase_id'))
+        qs = paginator.paginate_queryset(qs, request, view=self)
+        ser = PurchaseSerializer(qs, many=True, context={'include_items': include_items})
+        return Response({"success":True, "data": ser.data, "next": paginator.get_next_link()}, status=status.HTTP_200_OK)
 
     
     def post(self, request):
@@ -172,9 +248,13 @@ class TenantDataListCreateView(APIView):
         tenant = get_tenant(request)
         if not tenant:
             return Response({"error": "Tenant not resolved"}, status=400)
-        qs = TenantData.objects.all()
+        paginator = KeysetPagination(ordering=('id',))
+        qs = paginator.paginate_queryset(TenantData.objects.all(), request, view=self)
         ser = TenantDataSerializer(qs, many=True)
-        return Response(ser.data)
+        # This endpoint returns a bare list, so the next page goes in a Link header.
+        next_link = paginator.get_next_link()
+        headers = {'Link': f'<{next_link}>; rel="next"'} if next_link else None
+        return Response(ser.data, headers=headers)
 
     def post(self, request):
         tenant = get_tenant(request)
@@ -224,217 +304,71 @@ class TenantDataDetailView(APIView):
         obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
+def parse_ledger_range(request):
+    start_date_str = request.query_params.get('start_date')
+    end_date_str = request.query_params.get('end_date')
+
+    if not start_date_str or not end_date_str:
+        return None, None, Response({"error": "start_date and end_date are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    start_date = parse_datetime(start_date_str)
+    end_date = parse_datetime(end_date_str)
+
+    if not start_date or not end_date:
+        return None, None, Response({"error": "Invalid date format. Use ISO format like 2025-11-01T00:00:00Z"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if timezone.is_naive(start_date):
+        start_date = timezone.make_aware(start_date)
+    if timezone.is_naive(end_date):
+        end_date = timezone.make_aware(end_date)
+    end_date = end_date + datetime.timedelta(days=1) - datetime.timedelta(seconds=1)
+    return start_date, end_date, None
+
+
 class StockLedgerView(APIView):
-    def get(self, request):
-        start_date_str = request.query_params.get('start_date')
-        end_date_str = request.query_params.get('end_date')
-
-        if not start_date_str or not end_date_str:
-            return Response({"error": "start_date and end_date are required"}, status=status.HTTP_400_BAD_REQUEST)
-
-        start_date = parse_datetime(start_date_str)
-        end_date = parse_datetime(end_date_str) + datetime.timedelta(days=1) - datetime.timedelta(seconds=1) 
-
-        if not start_date or not end_date:
-            return Response({"error": "Invalid date format. Use ISO format like 2025-11-01T00:00:00Z"}, status=status.HTTP_400_BAD_REQUEST)
-
-        products = Product.objects.all()
-        ledger = []
-        for product in products:
-            opening_qty = Decimal('0')
-            opening_total_cost = Decimal('0')
-            opening_total_selling = Decimal('0')
-            batches = product.product_batch_set.filter(added_date__lt=start_date)
-            for batch in batches:
-                sales_after = batch.sales_items.filter(sale__created_at__gte=start_date).aggregate(total=Sum('quantity'))['total'] or 0
-                qty_at_open = batch.quantity + sales_after
-                opening_qty += qty_at_open
-                opening_total_cost += qty_at_open * batch.cost_rate
-                opening_total_selling += qty_at_open * batch.selling_rate
-            opening_avg_cost = opening_total_cost / opening_qty if opening_qty > 0 else Decimal('0')
-            opening_avg_selling = opening_total_selling / opening_qty if opening_qty > 0 else Decimal('0')
-            opening = {
-                'quantity': opening_qty,
-                'avg_cost_price': opening_avg_cost,
-                'avg_selling_price': opening_avg_selling
-            }
-
-            purchase_items = PurchaseItem.objects.filter(
-                purchase__purchase_date__gte=start_date,
-                purchase__purchase_date__lte=end_date,
-                product_batch__product=product
-            )
-            purchase_qty = purchase_items.aggregate(total=Sum('quantity'))['total'] or Decimal('0')
-            purchase_total_cost = purchase_items.aggregate(total=Sum('total_cost_price'))['total'] or Decimal('0')
-            purchase_total_selling = purchase_items.aggregate(total=Sum('total_selling_price'))['total'] or Decimal('0')
-            purchase_avg_cost = purchase_total_cost / purchase_qty if purchase_qty > 0 else Decimal('0')
-            purchase_avg_selling = purchase_total_selling / purchase_qty if purchase_qty > 0 else Decimal('0')
-            purchases = {
-                'quantity': purchase_qty,
-                'avg_cost_price': purchase_avg_cost,
-                'avg_selling_price': purchase_avg_selling
-            }
-
-            sales_items = SalesItem.objects.filter(
-                sale__created_at__gte=start_date,
-                sale__created_at__lte=end_date,
-                product_batch__product=product
-            )
-            sales_qty = sales_items.aggregate(total=Sum('quantity'))['total'] or Decimal('0')
-            sales_total_cost = sales_items.aggregate(total=Sum('total_cost_price'))['total'] or Decimal('0')
-            sales_total_selling = sales_items.aggregate(total=Sum('total_selling_price'))['total'] or Decimal('0')
-            sales_avg_cost = sales_total_cost / sales_qty if sales_qty > 0 else Decimal('0')
-            sales_avg_selling = sales_total_selling / sales_qty if sales_qty > 0 else Decimal('0')
-            sales = {
-                'quantity': sales_qty,
-                'avg_cost_price': sales_avg_cost,
-                'avg_selling_price': sales_avg_selling
-            }
-
-            closing_qty = Decimal('0')
-            closing_total_cost = Decimal('0')
-            closing_total_selling = Decimal('0')
-            batches = product.product_batch_set.filter(added_date__lte=end_date)
-            for batch in batches:
-                sales_after = batch.sales_items.filter(sale__created_at__gt=end_date).aggregate(total=Sum('quantity'))['total'] or 0
-                qty_at_close = batch.quantity + sales_after
-                closing_qty += qty_at_close
-                closing_total_cost += qty_at_close * batch.cost_rate
-                closing_total_selling += qty_at_close * batch.selling_rate
-            closing_avg_cost = closing_total_cost / closing_qty if closing_qty > 0 else Decimal('0')
-            closing_avg_selling = closing_total_selling / closing_qty if closing_qty > 0 else Decimal('0')
-            closing = {
-                'quantity': closing_qty,
-                'avg_cost_price': closing_avg_cost,
-                'avg_selling_price': closing_avg_selling
-            }
-            
-            ledger.append({
-                'product_name': product.name,
-                'opening': opening,
-                'purchases': purchases,
-                'sales': sales,
-                'closing': closing
-            })
+    renderer_classes = EXPORT_RENDERER_CLASSES
 
+    def get(self, request):
+        start_date, end_date, error = parse_ledger_range(request)
+        if error:
+            return error
+
+        fmt = export_format(request)
+        if fmt or wants_stream(request):
+            cached = get_cached_ledger('combined', start_date, end_date)
+            rows = iter(cached) if cached is not None else ledger_entries(iter_stock_ledger(start_date, end_date))
+            if fmt:
+                return export_response(fmt, 'stock-ledger', LEDGER_HEADER, ledger_rows(rows))
+            return json_stream_response({"success": True, "data": rows})
+
+        ledger = cached_ledger('combined', start_date, end_date,
+                               lambda: list(ledger_entries(iter_stock_ledger(start_date, end_date))))
         return Response({"success":True, "data":ledger})
     
     
 class StockLedgerSeparatedView(APIView):
+    renderer_classes = EXPORT_RENDERER_CLASSES
+
     def get(self, request):
-        start_date_str = request.query_params.get('start_date')
-        end_date_str = request.query_params.get('end_date')
-
-        if not start_date_str or not end_date_str:
-            return Response({"error": "start_date and end_date are required"}, status=status.HTTP_400_BAD_REQUEST)
-
-        start_date = parse_datetime(start_date_str)
-        end_date = parse_datetime(end_date_str) + datetime.timedelta(days=1) - datetime.timedelta(seconds=1) 
-
-        if not start_date or not end_date:
-            return Response({"error": "Invalid date format. Use ISO format like 2025-11-01T00:00:00Z"}, status=status.HTTP_400_BAD_REQUEST)
-
-        products = Product.objects.all()
-        openings_list = []
-        purchases_list = []
-        sales_list = []
-        closings_list = []
-
-        for product in products:
-            opening_qty = Decimal('0')
-            opening_total_cost = Decimal('0')
-            opening_total_selling = Decimal('0')
-            batches = product.product_batch_set.filter(added_date__lt=start_date)
-            for batch in batches:
-                sales_after = batch.sales_items.filter(sale__created_at__gte=start_date).aggregate(total=Sum('quantity'))['total'] or 0
-                qty_at_open = batch.quantity + sales_after
-                opening_qty += qty_at_open
-                opening_total_cost += qty_at_open * batch.cost_rate
-                opening_total_selling += qty_at_open * batch.selling_rate
-            if opening_qty > 0:
-                opening_avg_cost = opening_total_cost / opening_qty
-                opening_avg_selling = opening_total_selling / opening_qty
-                openings_list.append({
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'quantity': opening_qty,
-                    'avg_cost_price': opening_avg_cost,
-                    'avg_selling_price': opening_avg_selling
-                })
-
-  
-            purchase_items = PurchaseItem.objects.filter(
-                purchase__purchase_date__gte=start_date,
-                purchase__purchase_date__lte=end_date,
-                product_batch__product=product
-            )
-            purchase_qty = purchase_items.aggregate(total=Sum('quantity'))['total'] or Decimal('0')
-            if purchase_qty > 0:
-                purchase_total_cost = purchase_items.aggregate(total=Sum('total_cost_price'))['total'] or Decimal('0')
-                purchase_total_selling = purchase_items.aggregate(total=Sum('total_selling_price'))['total'] or Decimal('0')
-                purchase_avg_cost = purchase_total_cost / purchase_qty
-                purchase_avg_selling = purchase_total_selling / purchase_qty
-                purchases_list.append({
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'quantity': purchase_qty,
-                    'avg_cost_price': purchase_avg_cost,
-                    'avg_selling_price': purchase_avg_selling
-                })
-
-      
-            sales_items = SalesItem.objects.filter(
-                sale__created_at__gte=start_date,
-                sale__created_at__lte=end_date,
-                product_batch__product=product
-            )
-            sales_qty = sales_items.aggregate(total=Sum('quantity'))['total'] or Decimal('0')
-            if sales_qty > 0:
-                sales_total_cost = sales_items.aggregate(total=Sum('total_cost_price'))['total'] or Decimal('0')
-                sales_total_selling = sales_items.aggregate(total=Sum('total_selling_price'))['total'] or Decimal('0')
-                sales_avg_cost = sales_total_cost / sales_qty
-                sales_avg_selling = sales_total_selling / sales_qty
-                sales_list.append({
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'quantity': sales_qty,
-                    'avg_cost_price': sales_avg_cost,
-                    'avg_selling_price': sales_avg_selling
-                })
-
- 
-            closing_qty = Decimal('0')
-            closing_total_cost = Decimal('0')
-            closing_total_selling = Decimal('0')
-            batches = product.product_batch_set.filter(added_date__lte=end_date)
-            for batch in batches:
-                sales_after = batch.sales_items.filter(sale__created_at__gt=end_date).aggregate(total=Sum('quantity'))['total'] or 0
-                qty_at_close = batch.quantity + sales_after
-                closing_qty += qty_at_close
-                closing_total_cost += qty_at_close * batch.cost_rate
-                closing_total_selling += qty_at_close * batch.selling_rate
-            if closing_qty > 0:
-                closing_avg_cost = closing_total_cost / closing_qty
-                closing_avg_selling = closing_total_selling / closing_qty
-                closings_list.append({
-                    'product_id': product.id,
-                    'product_name': product.name,
-                    'quantity': closing_qty,
-                    'avg_cost_price': closing_avg_cost,
-                    'avg_selling_price': closing_avg_selling
-                })
-
-        # return Response({
-        #     'openings': openings_list,
-        #     'purchases': purchases_list,
-        #     'sales': sales_list,
-        #     'closings': closings_list
-        # })
-        
-        return Response({"success":True, "data":{
-            'openings': openings_list,
-            'purchases': purchases_list,
-            'sales': sales_list,
-            'closings': closings_list
-        }})
-        
\ No newline at end of file
+        start_date, end_date, error = parse_ledger_range(request)
+        if error:
+            return error
+
+        fmt = export_format(request)
+        if fmt or wants_stream(request):
+            cached = get_cached_ledger('separated', start_date, end_date)
+            if cached is not None:
+                buckets = {name: iter(entries) for name, entries in cached.items()}
+            else:
+                totals = {}
+                buckets = {
+                    name: bucket_entries(iter_stock_ledger(start_date, end_date, totals), section)
+                    for name, section in SEPARATED_BUCKETS
+                }
+            if fmt:
+                return export_response(fmt, 'stock-ledger-separated', SEPARATED_HEADER, separated_rows(buckets))
+            return json_stream_response({"success": True, "data": buckets})
+
+        ledger = cached_ledger('separated', start_date, end_date,
+                               lambda: separated_ledger(iter_stock_ledger(start_date, end_date)))
+        return Response({"success":True, "data":ledger})